@@ -0,0 +1,52 @@
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Tuple
+from .utils import debug_log
+
+
+def ttl_cache(ttl: float) -> Callable:
+    """
+    Cache a function's result in memory for a number of seconds
+
+    Entries are keyed by the call arguments. Concurrent misses are coalesced
+    so only one caller hits the upstream at a time. If refreshing an expired
+    entry raises, the stale value is returned instead of the error.
+
+    Args:
+        ttl: Number of seconds a cached result stays fresh
+    """
+
+    def decorator(func: Callable) -> Callable:
+        entries: Dict[Tuple, Dict[str, Any]] = {}
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+
+            entry = entries.get(key)
+            if entry is not None and time.monotonic() < entry["stale_at"]:
+                return entry["value"]
+
+            with lock:
+                # Another caller may have refreshed the entry while we waited
+                entry = entries.get(key)
+                now = time.monotonic()
+                if entry is not None and now < entry["stale_at"]:
+                    return entry["value"]
+
+                try:
+                    value = func(*args, **kwargs)
+                except Exception:
+                    if entry is None:
+                        raise
+                    debug_log(f"Serving stale cached result for {func.__name__}")
+                    return entry["value"]
+
+                entries[key] = {"value": value, "stale_at": now + ttl}
+                return value
+
+        return wrapper
+
+    return decorator
@@ -1,7 +1,13 @@
 import os
-import requests
+import threading
+import orjson
+import urllib3
+from urllib3.util.retry import Retry
 from typing import Optional, Dict, Any, Union
-from urllib.parse import urljoin
+from .utils import DEBUG
+
+# Bound once to skip the attribute lookup on every response
+_json_loads = orjson.loads
 
 
 class CheckOutAPIError(Exception):
@@ -19,6 +25,11 @@ class CheckOutAPIError(Exception):
 
 
 class CheckOutClient:
+    # Shared across all instances so keep-alive connections (and their TLS
+    # handshakes) are reused between calls
+    _pool: Optional[urllib3.PoolManager] = None
+    _pool_lock = threading.Lock()
+
     def __init__(self):
         # Remove /api/autocheckin from base_url as it's part of the path
         base_url = os.getenv("CHECKOUT_API_URL", "").rstrip("/")
@@ -35,6 +46,31 @@ class CheckOutClient:
 
         self.timeout = int(os.getenv("REQUESTS_TIMEOUT", "10"))
         self.verify_ssl = os.getenv("VERIFY_SSL", "0") == "1"
+        self.pool = self._get_pool(self.verify_ssl)
+
+        # Always include /api/autocheckin in the path
+        self._url_prefix = f"{self.base_url}/api/autocheckin/"
+        self._headers = {
+            "x-checkout-key": self.api_key,
+            "User-Agent": "AutoCheckin/1.0",
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+        }
+
+    @classmethod
+    def _get_pool(cls, verify_ssl: bool) -> urllib3.PoolManager:
+        """Return the shared connection pool, creating it on first use"""
+        with cls._pool_lock:
+            if cls._pool is None:
+                cls._pool = urllib3.PoolManager(
+                    num_pools=4,
+                    maxsize=50,
+                    retries=Retry(
+                        total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]
+                    ),
+                    cert_reqs="CERT_REQUIRED" if verify_ssl else "CERT_NONE",
+                )
+            return cls._pool
 
     def _make_request(
         self, method: str, path: str, data: Optional[Dict] = None
@@ -53,44 +89,45 @@ class CheckOutClient:
         Raises:
             CheckOutAPIError: If the request fails or returns non-200 status
         """
-        # Always include /api/autocheckin in the path
-        full_path = f"/api/autocheckin/{path.lstrip('/')}"
-        url = urljoin(self.base_url, full_path)
+        url = self._url_prefix + path.lstrip("/")
 
-        if os.getenv("FLASK_DEBUG") == "1":
+        if DEBUG:
             print(f"Making request to: {url}")
 
-        headers = {
-            "x-checkout-key": self.api_key,
-            "User-Agent": "AutoCheckin/1.0",
-            "Accept": "application/json",
-        }
+        body = None
+        if data is not None and method.upper() != "GET":
+            body = orjson.dumps(data)
 
         try:
-            response = requests.request(
-                method=method,
-                url=url,
-                headers=headers,
-                json=data if method.upper() != "GET" else None,
+            response = self.pool.request(
+                method,
+                url,
+                body=body,
+                headers=self._headers,
                 timeout=self.timeout,
-                verify=self.verify_ssl,
             )
+        except urllib3.exceptions.HTTPError as e:
+            raise CheckOutAPIError(f"Request failed: {str(e)}")
 
-            # Raise for bad status codes
-            response.raise_for_status()
+        status_code = response.status
+        if status_code >= 400:
+            raise CheckOutAPIError(
+                f"Request failed: HTTP {status_code} for url: {url}", status_code
+            )
 
-            data = response.json()
-            if not data.get("success", False):
-                raise CheckOutAPIError(
-                    f"API returned success=false: {data.get('message', 'No message provided')}",
-                    response.status_code,
-                    data,
-                )
+        try:
+            data = _json_loads(response.data) if response.data else {}
+        except orjson.JSONDecodeError as e:
+            raise CheckOutAPIError(f"Request failed: {str(e)}", status_code)
+
+        if not data.get("success", False):
+            raise CheckOutAPIError(
+                f"API returned success=false: {data.get('message', 'No message provided')}",
+                status_code,
+                data,
+            )
 
-            return data
-
-        except requests.exceptions.RequestException as e:
-            raise CheckOutAPIError(f"Request failed: {str(e)}")
+        return data
 
     def get(self, path: str) -> Dict[str, Any]:
         """Make a GET request to the CheckOut API"""
@@ -107,3 +144,22 @@ class CheckOutClient:
             return True
         except CheckOutAPIError:
             return False
+
+
+_default_client: Optional[CheckOutClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> CheckOutClient:
+    """
+    Return the process-wide CheckOutClient, creating it on first use
+
+    Raises:
+        ValueError: If the CheckOut API environment variables are not set
+    """
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = CheckOutClient()
+    return _default_client
@@ -1,5 +1,5 @@
 from typing import List, Dict, Any
-from .checkout_client import CheckOutClient, CheckOutAPIError
+from .checkout_client import get_default_client, CheckOutAPIError
 from .state import state
 from datetime import datetime
 
@@ -11,13 +11,17 @@ def fetch_users() -> bool:
     Returns:
         bool: True if successful, False if failed
     """
-    client = CheckOutClient()
+    client = get_default_client()
 
     try:
         response = client.get("users")
         users = response.get("autoCheckinUsers", [])
-        state.set_data("autoCheckinUsers", users)
-        state.set_data("last_users_fetch", datetime.utcnow().isoformat())
+        state.update(
+            {
+                "autoCheckinUsers": users,
+                "last_users_fetch": datetime.utcnow().isoformat(),
+            }
+        )
         return True
 
     except CheckOutAPIError as e:
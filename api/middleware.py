@@ -1,13 +1,41 @@
 from functools import wraps
 from flask import request, current_app
+import hmac
 import os
-from api.utils import create_response
+from api.utils import static_response
+
+# Read once at import; the environment doesn't change while the server runs
+_IS_DEV = os.getenv("FLASK_ENV") == "development"
+
+# Authentication is skipped entirely in development
+AUTH_ENABLED = not _IS_DEV
+_EXPECTED_KEY = os.getenv("CHECKOUT_API_KEY")
+_EXPECTED_KEY_BYTES = _EXPECTED_KEY.encode() if _EXPECTED_KEY else None
+
+_MISSING_KEY_RESPONSE = static_response(
+    success=False,
+    message="Authentication Failed",
+    error="Missing x-checkout-key header",
+    status_code=401,
+)
+_NOT_CONFIGURED_RESPONSE = static_response(
+    success=False,
+    message="Server Configuration Error",
+    error="CHECKOUT_API_KEY not configured on server",
+    status_code=500,
+)
+_INVALID_KEY_RESPONSE = static_response(
+    success=False,
+    message="Authentication Failed",
+    error="Invalid API key",
+    status_code=401,
+)
 
 
 def check_api_key():
     """Check if the request should be authenticated and validate API key"""
     # Skip authentication in development environment
-    if os.getenv("FLASK_ENV") == "development":
+    if _IS_DEV:
         return None
 
     # (Don't) Skip authentication for specific endpoints that should be public
@@ -15,37 +43,26 @@ def check_api_key():
     #     return None
 
     api_key = request.headers.get("x-checkout-key")
-    expected_api_key = os.getenv("CHECKOUT_API_KEY")
 
     if not api_key:
-        return create_response(
-            success=False,
-            message="Authentication Failed",
-            error="Missing x-checkout-key header",
-            status_code=401,
-        )
-
-    if not expected_api_key:
-        return create_response(
-            success=False,
-            message="Server Configuration Error",
-            error="CHECKOUT_API_KEY not configured on server",
-            status_code=500,
-        )
-
-    if api_key != expected_api_key:
-        return create_response(
-            success=False,
-            message="Authentication Failed",
-            error="Invalid API key",
-            status_code=401,
-        )
+        return _MISSING_KEY_RESPONSE()
+
+    if not _EXPECTED_KEY:
+        return _NOT_CONFIGURED_RESPONSE()
+
+    # Constant-time comparison to avoid leaking the key through timing
+    if not hmac.compare_digest(api_key.encode(), _EXPECTED_KEY_BYTES):
+        return _INVALID_KEY_RESPONSE()
 
     return None
 
 
 # Keep the decorator for specific routes if needed
 def require_api_key(f):
+    # Leave the route unwrapped when authentication is disabled
+    if not AUTH_ENABLED:
+        return f
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         result = check_api_key()
@@ -1,18 +1,128 @@
-from flask import Blueprint, request
-from api.utils import create_response
+from flask import Blueprint, Response, request, stream_with_context
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import orjson
+from dataclasses import dataclass
+from typing import Optional
+from api.utils import create_response, static_response
+from api.week_mapping import WEEK_TABLE
 from scripts.session_refresh import (
     get_all_refresh_sessions,
     get_refresh_session_by_email,
 )
 from api.fetch_users import fetch_users
-from scripts.code_submission import try_codes_for_all_users, get_codes
+from api.state import trigger_connection_check
+from scripts.code_submission import try_codes_for_all_users, get_sorted_codes
 from scripts.attendance_scheduler import (
     fetch_all_users_attendance,
     fetch_user_attendance_by_email,
+    sync_users_attendance_data,
 )
 
+__all__ = ["session_bp"]
+
 session_bp = Blueprint("session", __name__)
 
+# Maximum number of weeks fetched concurrently by /fetch-prior-attendance
+PRIOR_ATTENDANCE_WORKERS = 4
+
+# Accepted ranges for the optional year and week query parameters
+YEAR_RANGE = (2000, 2100)
+WEEK_RANGE = (1, 53)
+
+_MISSING_EMAIL_RESPONSE = static_response(
+    success=False,
+    message="Email parameter is required",
+    error="Missing email parameter",
+    status_code=400,
+)
+_MISSING_PRIOR_TARGET_RESPONSE = static_response(
+    success=False,
+    message="Either email parameter or fetchall=true is required",
+    error="Missing required parameters",
+    status_code=400,
+)
+
+
+class QueryValidationError(ValueError):
+    """Raised when a query parameter fails validation"""
+
+    def __init__(self, name: str, message: str):
+        super().__init__(message)
+        self.name = name
+
+
+def _parse_int_arg(args, name: str, bounds: tuple) -> Optional[int]:
+    """Parse an optional integer query parameter and check it is within bounds"""
+    raw = args.get(name)
+    if not raw:
+        return None
+
+    low, high = bounds
+    value = args.get(name, type=int)
+    if value is None or not low <= value <= high:
+        raise QueryValidationError(
+            name, f"{name} must be an integer between {low} and {high}"
+        )
+    return value
+
+
+@dataclass(frozen=True)
+class AttendanceQuery:
+    """Validated query parameters shared by the attendance endpoints"""
+
+    email: Optional[str] = None
+    year: Optional[int] = None
+    week: Optional[int] = None
+    fetchall: bool = False
+
+    @classmethod
+    def from_args(cls, args) -> "AttendanceQuery":
+        """Build a query from request.args
+
+        Raises:
+            QueryValidationError: If year or week is malformed or out of range
+        """
+        return cls(
+            email=args.get("email") or None,
+            year=_parse_int_arg(args, "year", YEAR_RANGE),
+            week=_parse_int_arg(args, "week", WEEK_RANGE),
+            fetchall=args.get("fetchall", "false").lower() == "true",
+        )
+
+
+@session_bp.errorhandler(QueryValidationError)
+def handle_query_validation_error(error: QueryValidationError):
+    return create_response(
+        success=False,
+        message=f"Invalid {error.name} parameter",
+        error=str(error),
+        status_code=400,
+    )
+
+
+# Success message templates keyed by which of year/week were supplied
+_ATTENDANCE_MSG_TEMPLATES = {
+    (True, True): "{prefix} for year {year}, week {week} completed successfully",
+    (True, False): "{prefix} for year {year} completed successfully",
+    (False, True): "{prefix} for week {week} completed successfully",
+    (False, False): "{prefix} completed successfully",
+}
+
+
+def _fmt_attendance_msg(prefix: str, year: Optional[int], week: Optional[int]) -> str:
+    """Build the success message for an attendance fetch.
+
+    Args:
+        prefix: Start of the message, e.g. "Attendance fetch"
+        year: Requested year, if any
+        week: Requested week, if any
+
+    Returns:
+        str: Message mentioning whichever of year and week were supplied
+    """
+    template = _ATTENDANCE_MSG_TEMPLATES[(bool(year), bool(week))]
+    return template.format(prefix=prefix, year=year, week=week)
+
 
 @session_bp.route("/refresh", methods=["GET"])
 def get_all_sessions():
@@ -44,6 +154,9 @@ def get_session(email: str):
 def trigger_fetch_users():
     """Trigger a new fetch of users from the CheckOut API"""
     success = fetch_users()
+    if not success:
+        # Let the connection monitor re-check now instead of at its next interval
+        trigger_connection_check()
     return create_response(
         success=success,
         message="User fetch completed" if success else "User fetch failed",
@@ -61,39 +174,24 @@ def try_codes():
 @session_bp.route("/codes", methods=["GET"])
 def get_available_codes():
     """Get available codes from CheckOut API"""
-    codes = get_codes()
     return create_response(
-        message="Available codes retrieved successfully", data={"codes": sorted(codes)}
+        message="Available codes retrieved successfully",
+        data={"codes": get_sorted_codes()},
     )
 
 
 @session_bp.route("/fetch-attendance", methods=["GET"])
 def fetch_attendance():
     """Trigger attendance fetch for all users"""
-    try:
-        # Get optional year and week parameters
-        year = request.args.get("year")
-        week = request.args.get("week")
-
-        # Convert to integers if provided
-        year = int(year) if year else None
-        week = int(week) if week else None
+    query = AttendanceQuery.from_args(request.args)
+    year, week = query.year, query.week
 
+    try:
         fetch_all_users_attendance(force_run=True, year=year, week=week)
 
-        # Include the year and week in the response message
-        message = "Attendance fetch completed successfully"
-        if year and week:
-            message = (
-                f"Attendance fetch for year {year}, week {week} completed successfully"
-            )
-        elif year:
-            message = f"Attendance fetch for year {year} completed successfully"
-        elif week:
-            message = f"Attendance fetch for week {week} completed successfully"
-
         return create_response(
-            message=message, data={"success": True, "year": year, "week": week}
+            message=_fmt_attendance_msg("Attendance fetch", year, week),
+            data={"success": True, "year": year, "week": week},
         )
     except Exception as e:
         return create_response(
@@ -107,41 +205,22 @@ def fetch_attendance():
 @session_bp.route("/fetch-attendance-by-user", methods=["GET"])
 def fetch_attendance_by_user():
     """Trigger attendance fetch for a specific user by email"""
-    email = request.args.get("email")
+    query = AttendanceQuery.from_args(request.args)
+    email, year, week = query.email, query.year, query.week
 
     if not email:
-        return create_response(
-            success=False,
-            message="Email parameter is required",
-            error="Missing email parameter",
-            status_code=400,
-        )
+        return _MISSING_EMAIL_RESPONSE()
 
     try:
-        # Get optional year and week parameters
-        year = request.args.get("year")
-        week = request.args.get("week")
-
-        # Convert to integers if provided
-        year = int(year) if year else None
-        week = int(week) if week else None
-
         success = fetch_user_attendance_by_email(
             email, force_run=True, year=year, week=week
         )
 
         if success:
-            # Include the year and week in the response message
-            message = f"Attendance fetch for {email} completed successfully"
-            if year and week:
-                message = f"Attendance fetch for {email} for year {year}, week {week} completed successfully"
-            elif year:
-                message = f"Attendance fetch for {email} for year {year} completed successfully"
-            elif week:
-                message = f"Attendance fetch for {email} for week {week} completed successfully"
-
             return create_response(
-                message=message,
+                message=_fmt_attendance_msg(
+                    f"Attendance fetch for {email}", year, week
+                ),
                 data={"success": True, "email": email, "year": year, "week": week},
             )
         else:
@@ -160,120 +239,6 @@ def fetch_attendance_by_user():
         )
 
 
-weekNumberMapping = (
-    [
-        {"weekCommencing": "2024-09-16", "weekEnding": "2024-09-22", "weekNumber": "F"},
-        {"weekCommencing": "2024-09-23", "weekEnding": "2024-09-29", "weekNumber": "1"},
-        {"weekCommencing": "2024-09-30", "weekEnding": "2024-10-06", "weekNumber": "2"},
-        {"weekCommencing": "2024-10-07", "weekEnding": "2024-10-13", "weekNumber": "3"},
-        {"weekCommencing": "2024-10-14", "weekEnding": "2024-10-20", "weekNumber": "4"},
-        {"weekCommencing": "2024-10-21", "weekEnding": "2024-10-27", "weekNumber": "5"},
-        {"weekCommencing": "2024-10-28", "weekEnding": "2024-11-03", "weekNumber": "C"},
-        {"weekCommencing": "2024-11-04", "weekEnding": "2024-11-10", "weekNumber": "6"},
-        {"weekCommencing": "2024-11-11", "weekEnding": "2024-11-17", "weekNumber": "7"},
-        {"weekCommencing": "2024-11-18", "weekEnding": "2024-11-24", "weekNumber": "8"},
-        {"weekCommencing": "2024-11-25", "weekEnding": "2024-12-01", "weekNumber": "9"},
-        {
-            "weekCommencing": "2024-12-02",
-            "weekEnding": "2024-12-08",
-            "weekNumber": "10",
-        },
-        {
-            "weekCommencing": "2024-12-09",
-            "weekEnding": "2024-12-15",
-            "weekNumber": "11",
-        },
-        {"weekCommencing": "2024-12-16", "weekEnding": "2024-12-22", "weekNumber": "V"},
-        {"weekCommencing": "2024-12-23", "weekEnding": "2024-12-29", "weekNumber": "V"},
-        {"weekCommencing": "2024-12-30", "weekEnding": "2025-01-05", "weekNumber": "V"},
-        {
-            "weekCommencing": "2025-01-06",
-            "weekEnding": "2025-01-12",
-            "weekNumber": "RV",
-        },
-        {
-            "weekCommencing": "2025-01-13",
-            "weekEnding": "2025-01-19",
-            "weekNumber": "RA",
-        },
-        {
-            "weekCommencing": "2025-01-20",
-            "weekEnding": "2025-01-26",
-            "weekNumber": "RA",
-        },
-        {
-            "weekCommencing": "2025-01-27",
-            "weekEnding": "2025-02-02",
-            "weekNumber": "RA",
-        },
-        {
-            "weekCommencing": "2025-02-03",
-            "weekEnding": "2025-02-09",
-            "weekNumber": "Rf",
-        },
-        {"weekCommencing": "2025-02-10", "weekEnding": "2025-02-16", "weekNumber": "1"},
-        {"weekCommencing": "2025-02-17", "weekEnding": "2025-02-23", "weekNumber": "2"},
-        {"weekCommencing": "2025-02-24", "weekEnding": "2025-03-02", "weekNumber": "3"},
-        {"weekCommencing": "2025-03-03", "weekEnding": "2025-03-09", "weekNumber": "4"},
-        {"weekCommencing": "2025-03-10", "weekEnding": "2025-03-16", "weekNumber": "5"},
-        {"weekCommencing": "2025-03-17", "weekEnding": "2025-03-23", "weekNumber": "6"},
-        {"weekCommencing": "2025-03-24", "weekEnding": "2025-03-30", "weekNumber": "7"},
-        {"weekCommencing": "2025-03-31", "weekEnding": "2025-04-06", "weekNumber": "8"},
-        {"weekCommencing": "2025-04-07", "weekEnding": "2025-04-13", "weekNumber": "V"},
-        {"weekCommencing": "2025-04-14", "weekEnding": "2025-04-20", "weekNumber": "V"},
-        {"weekCommencing": "2025-04-21", "weekEnding": "2025-04-27", "weekNumber": "9"},
-        {
-            "weekCommencing": "2025-04-28",
-            "weekEnding": "2025-05-04",
-            "weekNumber": "10",
-        },
-        {
-            "weekCommencing": "2025-05-05",
-            "weekEnding": "2025-05-11",
-            "weekNumber": "11",
-        },
-        {
-            "weekCommencing": "2025-05-12",
-            "weekEnding": "2025-05-18",
-            "weekNumber": "RV",
-        },
-        {
-            "weekCommencing": "2025-05-19",
-            "weekEnding": "2025-05-25",
-            "weekNumber": "RA",
-        },
-        {
-            "weekCommencing": "2025-05-26",
-            "weekEnding": "2025-06-01",
-            "weekNumber": "RA",
-        },
-        {
-            "weekCommencing": "2025-06-02",
-            "weekEnding": "2025-06-08",
-            "weekNumber": "RA",
-        },
-    ],
-)
-
-from datetime import datetime
-
-
-def get_iso_week_number(date_str):
-    """
-    Convert a date string to ISO week number within the year.
-
-    Args:
-        date_str (str): Date string in format 'YYYY-MM-DD'
-
-    Returns:
-        tuple: (year, week_number)
-    """
-    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-    year = date_obj.year
-    week = date_obj.isocalendar()[1]
-    return year, week
-
-
 @session_bp.route("/fetch-prior-attendance", methods=["GET"])
 def fetch_prior_attendance():
     """
@@ -283,90 +248,105 @@ def fetch_prior_attendance():
     Query Parameters:
         email (str): Email of the user to fetch attendance for (required unless fetchall=true)
         fetchall (bool): If true, fetch for all users instead of a specific email
+        stream (bool): If true, stream each week's result as NDJSON as it completes
     """
-    email = request.args.get("email")
-    fetch_all = request.args.get("fetchall", "false").lower() == "true"
+    query = AttendanceQuery.from_args(request.args)
+    email, fetch_all = query.email, query.fetchall
+    stream = request.args.get("stream", "false").lower() == "true"
 
     if not email and not fetch_all:
-        return create_response(
-            success=False,
-            message="Either email parameter or fetchall=true is required",
-            error="Missing required parameters",
-            status_code=400,
+        return _MISSING_PRIOR_TARGET_RESPONSE()
+
+    def fetch_week(year: int, week_number: int) -> str:
+        if fetch_all:
+            # Fetch for all users
+            fetch_all_users_attendance(
+                force_run=True, year=year, week=week_number, sync=False
+            )
+            return "success"
+
+        # Fetch for specific user
+        success = fetch_user_attendance_by_email(
+            email, force_run=True, year=year, week=week_number, sync=False
+        )
+        return "success" if success else "failed"
+
+    def submit_weeks(executor: ThreadPoolExecutor) -> dict:
+        # Submit each week in the mapping to run concurrently
+        return {
+            executor.submit(fetch_week, entry.iso_year, entry.iso_week): {
+                "weekCommencing": entry.week_commencing,
+                "weekNumber": entry.week_number,
+                "isoYear": entry.iso_year,
+                "isoWeek": entry.iso_week,
+            }
+            for entry in WEEK_TABLE
+        }
+
+    message = "Prior attendance fetch completed"
+    if email:
+        message = f"Prior attendance fetch for {email} completed"
+
+    # Get the total number of weeks in the mapping
+    total_weeks = len(WEEK_TABLE)
+
+    if stream:
+
+        def generate():
+            successful = failed = 0
+            with ThreadPoolExecutor(max_workers=PRIOR_ATTENDANCE_WORKERS) as executor:
+                submitted = submit_weeks(executor)
+
+                # Emit each week as soon as it finishes
+                for future in as_completed(submitted):
+                    week_info = submitted[future]
+                    try:
+                        line = {**week_info, "status": future.result()}
+                        successful += 1
+                    except Exception as e:
+                        line = {**week_info, "error": str(e)}
+                        failed += 1
+                    yield orjson.dumps(line) + b"\n"
+
+            # Sync all fetched weeks to CheckOut in one post per user
+            sync_users_attendance_data(None if fetch_all else email)
+
+            yield orjson.dumps(
+                {
+                    "_summary": {
+                        "success": failed == 0,
+                        "message": message,
+                        "totalWeeks": total_weeks,
+                        "successfulFetches": successful,
+                        "failedFetches": failed,
+                    }
+                }
+            ) + b"\n"
+
+        return Response(
+            stream_with_context(generate()), mimetype="application/x-ndjson"
         )
 
     results = []
     errors = []
 
     try:
-        # Get the actual list from the weekNumberMapping tuple
-        mapping_list = (
-            weekNumberMapping[0]
-            if isinstance(weekNumberMapping, tuple)
-            else weekNumberMapping
-        )
 
-        # Process each week in the mapping
-        for week_data in mapping_list:
-            # Access dictionary items directly instead of using .get()
-            if "weekCommencing" not in week_data:
-                continue
-
-            week_commencing = week_data["weekCommencing"]
-            week_number_label = week_data.get("weekNumber", "")
-
-            # Calculate ISO year and week number from the weekCommencing date
-            year, week_number = get_iso_week_number(week_commencing)
-
-            try:
-                if fetch_all:
-                    # Fetch for all users
-                    fetch_all_users_attendance(
-                        force_run=True, year=year, week=week_number
-                    )
-                    results.append(
-                        {
-                            "weekCommencing": week_commencing,
-                            "weekNumber": week_number_label,
-                            "isoYear": year,
-                            "isoWeek": week_number,
-                            "status": "success",
-                        }
-                    )
-                else:
-                    # Fetch for specific user
-                    success = fetch_user_attendance_by_email(
-                        email, force_run=True, year=year, week=week_number
-                    )
-                    status = "success" if success else "failed"
-                    results.append(
-                        {
-                            "weekCommencing": week_commencing,
-                            "weekNumber": week_number_label,
-                            "isoYear": year,
-                            "isoWeek": week_number,
-                            "status": status,
-                        }
-                    )
-            except Exception as e:
-                errors.append(
-                    {
-                        "weekCommencing": week_commencing,
-                        "weekNumber": week_number_label,
-                        "isoYear": year,
-                        "isoWeek": week_number,
-                        "error": str(e),
-                    }
-                )
+        with ThreadPoolExecutor(max_workers=PRIOR_ATTENDANCE_WORKERS) as executor:
+            submitted = submit_weeks(executor)
+
+            # Collect results in calendar order
+            for future, week_info in submitted.items():
+                try:
+                    results.append({**week_info, "status": future.result()})
+                except Exception as e:
+                    errors.append({**week_info, "error": str(e)})
+
+        # Sync all fetched weeks to CheckOut in one post per user
+        sync_users_attendance_data(None if fetch_all else email)
 
         # Determine overall success based on errors
         success = len(errors) == 0
-        message = "Prior attendance fetch completed"
-        if email:
-            message = f"Prior attendance fetch for {email} completed"
-
-        # Get the total number of weeks in the mapping
-        total_weeks = len(mapping_list)
 
         return create_response(
             success=success,
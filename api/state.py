@@ -1,15 +1,37 @@
-import json
+import asyncio
+import copy
+import orjson
 import os
-from typing import Dict, Any
-from .checkout_client import CheckOutClient
-from .utils import debug_log
+import random
+import threading
+from typing import Callable, Dict, Any, List, Optional
+from .checkout_client import get_default_client
+from .utils import debug_log, DEBUG
 
 STATE_FILE = os.path.join(
     os.path.dirname(os.path.dirname(__file__)), "data", "state.json"
 )
 
+# Keys written by earlier versions that are no longer stored
+_LEGACY_KEYS = ("next_cycle_run_time",)
+
+# Immutable value types whose equality means nothing needs persisting
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
 
 class GlobalState:
+    """Process-wide application state persisted to data/state.json
+
+    The current state is an immutable snapshot dict. Reads (is_connected,
+    get_data, get_snapshot) take no lock; they load the snapshot reference once.
+    Writers hold a lock, build a new snapshot and publish it with a single
+    assignment, so readers never see a partially applied update.
+
+    Only the top-level snapshot is copied on write. Values returned by
+    get_data are the live stored objects, and callers that change them in
+    place must persist them with set_data or update.
+    """
+
     _instance = None
 
     def __new__(cls):
@@ -19,74 +41,210 @@ class GlobalState:
         return cls._instance
 
     def _initialize(self):
-        """Initialize the state file if it doesn't exist"""
+        """Initialize the state file if it doesn't exist and load it into memory"""
+        # Serialises writers and file writes; readers never take it
+        self._lock = threading.RLock()
+        self._version = 0
+        # (autoCheckinUsers list, email -> user dict) built from that list
+        self._users_index = (None, {})
         self.default_state = {
             "connected": False,
             "last_users_fetch": None,
             "last_all_session_refresh": None,
             "last_individual_session_refresh": None,
-            "next_cycle_run_time": None,
+            "next_cycle_run_epoch": None,
             "last_attendance_fetch_run": None,
             "autoCheckinUsers": [],
         }
 
-        # Create state file if it doesn't exist
-        if not os.path.exists(STATE_FILE):
-            os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
-            self._save_state(self.default_state)
+        # The in-memory snapshot is the source of truth; the file is only
+        # written through on mutation so state survives a restart
+        self._snapshot = self._load_state()
 
     def _load_state(self) -> Dict[str, Any]:
-        """Load state from JSON file"""
-        try:
-            with open(STATE_FILE, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return self.default_state.copy()
+        """Load state from JSON file, creating it if it doesn't exist"""
+        with self._lock:
+            try:
+                with open(STATE_FILE, "rb") as f:
+                    # Fill in keys added since the file was last written
+                    loaded = {**self.default_state, **orjson.loads(f.read())}
+                # Dropped here so the next save removes them from the file
+                for key in _LEGACY_KEYS:
+                    loaded.pop(key, None)
+                return loaded
+            except FileNotFoundError:
+                # First run: create the file rather than checking for it up front
+                state = copy.deepcopy(self.default_state)
+                os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+                self._save_state(state)
+                return state
+            except orjson.JSONDecodeError:
+                return copy.deepcopy(self.default_state)
 
     def _save_state(self, state: Dict[str, Any]) -> None:
-        """Save state to JSON file"""
-        with open(STATE_FILE, "w") as f:
-            json.dump(state, f, indent=2)
+        """Save state to JSON file
+
+        Writes to a temporary file and renames it over the real one, so a crash
+        mid-write leaves the previous state intact rather than a truncated file.
+        """
+        payload = orjson.dumps(
+            state, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        )
+        tmp_file = STATE_FILE + ".tmp"
+        with self._lock:
+            with open(tmp_file, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, STATE_FILE)
+
+    def _publish(self, snapshot: Dict[str, Any]) -> None:
+        """Persist a new snapshot and make it visible to readers
+
+        Must be called with the lock held.
+        """
+        self._save_state(snapshot)
+        self._snapshot = snapshot
+        self._version += 1
 
     def set_connected(self, status: bool) -> None:
-        state = self._load_state()
-        if state["connected"] != status:
-            state["connected"] = status
-            self._save_state(state)
-            debug_log(f"Connection status changed to: {status}")
+        with self._lock:
+            if self._snapshot["connected"] != status:
+                self._publish({**self._snapshot, "connected": status})
+                if DEBUG:
+                    debug_log(f"Connection status changed to: {status}")
 
     def is_connected(self) -> bool:
-        return self._load_state()["connected"]
+        return self._snapshot["connected"]
 
     def set_data(self, key: str, value: Any) -> None:
-        state = self._load_state()
-        debug_log(f"Setting state data for key: {key}")
-        state[key] = value
-        self._save_state(state)
+        with self._lock:
+            # Skip the write when a plain value hasn't changed. Containers are
+            # always written, since callers may have changed them in place
+            current = self._snapshot.get(key)
+            if (
+                isinstance(value, _SCALAR_TYPES)
+                and type(current) is type(value)
+                and current == value
+            ):
+                return
+            if DEBUG:
+                debug_log(f"Setting state data for key: {key}")
+            self._publish({**self._snapshot, key: value})
         # debug_log(f"State data after update - {key}: {value}")
 
+    def update(self, values: Dict[str, Any]) -> None:
+        """Set several keys with a single write to disk"""
+        with self._lock:
+            if DEBUG:
+                debug_log(f"Setting state data for keys: {', '.join(values)}")
+            self._publish({**self._snapshot, **values})
+
+    def _get_users_index(self) -> Dict[str, Dict[str, Any]]:
+        """Return an email -> user index of the current autoCheckinUsers list
+
+        Rebuilt only when a different list has been stored since the last call.
+        """
+        users = self._snapshot.get("autoCheckinUsers") or []
+        indexed_users, index = self._users_index
+        if indexed_users is not users:
+            # Reversed so the first user with a given email wins, as in a scan
+            index = {user.get("email"): user for user in reversed(users)}
+            self._users_index = (users, index)
+        return index
+
+    def get_user(self, email: str) -> Optional[Dict[str, Any]]:
+        """Return the stored user with the given email, or None
+
+        Like get_data, this is the live in-memory dict.
+        """
+        return self._get_users_index().get(email)
+
+    def update_user(self, email: str, values: Dict[str, Any]) -> bool:
+        """Update fields of a single user in autoCheckinUsers and persist them
+
+        The user is replaced by an updated copy in a new list, so readers of
+        the previous snapshot never see the change half applied.
+
+        Args:
+            email: Email of the user to update
+            values: Fields to set on the stored user dict
+
+        Returns:
+            bool: True if the user was found and updated, False otherwise
+        """
+        with self._lock:
+            user = self._get_users_index().get(email)
+            if user is None:
+                return False
+            users = [
+                {**stored, **values} if stored is user else stored
+                for stored in self._snapshot["autoCheckinUsers"]
+            ]
+            self._publish({**self._snapshot, "autoCheckinUsers": users})
+        return True
+
+    def update_users(
+        self,
+        transform: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+        values: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Replace autoCheckinUsers with a transformed copy and persist it
+
+        The transform runs under the writer lock against the current list, so
+        no other write can land between reading the users and publishing them.
+        It must return a new list and must not modify the users it is given.
+
+        Args:
+            transform: Builds the new users list from the stored one
+            values: Other keys to set in the same write
+        """
+        with self._lock:
+            users = transform(self._snapshot.get("autoCheckinUsers") or [])
+            self._publish(
+                {**self._snapshot, **(values or {}), "autoCheckinUsers": users}
+            )
+
     def get_data(self, key: str) -> Any:
-        return self._load_state().get(key)
+        """Return the stored value for key
+
+        The value is the live in-memory object, so changes to it must be
+        followed by set_data or update to be persisted.
+        """
+        return self._snapshot.get(key)
 
-    def dump_state(self) -> None:
-        """Debug method to dump entire state"""
-        state = self._load_state()
-        # debug_log("\n=== CURRENT STATE DUMP ===")
-        # for key, value in state.items():
-        #     debug_log(f"{key}: {value}")
-        # debug_log("=========================\n")
+    @property
+    def version(self) -> int:
+        """Number of snapshots published so far; increases on every change"""
+        return self._version
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """Return the current state snapshot in a single read
+
+        The snapshot is shared and must not be modified.
+        """
+        return self._snapshot
 
 
 # Create a global instance
 state = GlobalState()
 
+# Set to wake connection_monitor before its interval elapses; both are bound
+# when the monitor starts on its event loop
+_monitor_loop: Optional[asyncio.AbstractEventLoop] = None
+_wake: Optional[asyncio.Event] = None
+
 
 def test_connection() -> bool:
     """Test connection to the checkout API"""
-    client = CheckOutClient()
+    client = get_default_client()
     return client.test_connection()
 
 
+# Resolved on first use by fetch_and_update_state
+_fetch_users = None
+
+
 def fetch_and_update_state() -> bool:
     """
     Fetch users and update connection state based on the result
@@ -94,31 +252,60 @@ def fetch_and_update_state() -> bool:
     Returns:
         bool: True if successful, False if failed
     """
-    from .fetch_users import fetch_users  # Import here to avoid circular imports
+    global _fetch_users
+    if _fetch_users is None:
+        # Imported lazily to avoid circular imports, then kept for later calls
+        from .fetch_users import fetch_users as _fetch_users
 
-    success = fetch_users()
+    success = _fetch_users()
     if not success:
         state.set_connected(False)
     return success
 
 
-def connection_monitor() -> None:
-    """Monitor connection status and fetch users periodically"""
-    import time
+def trigger_connection_check() -> None:
+    """Wake the connection monitor so it re-checks the connection immediately
+
+    Safe to call from any thread.
+    """
+    loop, wake = _monitor_loop, _wake
+    if loop is not None and wake is not None:
+        loop.call_soon_threadsafe(wake.set)
+
+
+async def connection_monitor() -> None:
+    """Monitor connection status and fetch users periodically
 
-    RETRY_INTERVAL = 60  # Retry every minute when disconnected
+    The connection test and user fetch are blocking, so they run in worker
+    threads to keep the shared scheduler event loop free.
+    """
+    RETRY_INTERVAL = 60  # First retry after a minute when disconnected
+    MAX_RETRY_INTERVAL = 600  # Back off to at most every 10 minutes
+    RETRY_JITTER = 10  # Up to this many extra seconds, so retries don't align
     UPDATE_INTERVAL = 3600  # Update every hour when connected
 
+    global _monitor_loop, _wake
+    _monitor_loop = asyncio.get_running_loop()
+    _wake = asyncio.Event()
+
+    failures = 0
     while True:
-        success = test_connection()
+        success = await asyncio.to_thread(test_connection)
         state.set_connected(success)
 
-        if success:
-            # Try to fetch users immediately after connecting
-            fetch_success = fetch_and_update_state()
-            if fetch_success:
-                time.sleep(UPDATE_INTERVAL)
-            else:
-                time.sleep(RETRY_INTERVAL)
+        # Try to fetch users immediately after connecting
+        if success and await asyncio.to_thread(fetch_and_update_state):
+            failures = 0
+            interval = UPDATE_INTERVAL
         else:
-            time.sleep(RETRY_INTERVAL)
+            interval = min(
+                RETRY_INTERVAL * 2**failures, MAX_RETRY_INTERVAL
+            ) + random.uniform(0, RETRY_JITTER)
+            failures += 1
+
+        # Sleep until the interval passes or trigger_connection_check is called
+        try:
+            await asyncio.wait_for(_wake.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
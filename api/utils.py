@@ -1,7 +1,12 @@
-from flask import jsonify
-from typing import Any, Optional
-from datetime import datetime, timezone
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+from typing import Any, Callable, Optional
 import os
+import time
+import orjson
+
+# Read once at import; main.py loads .env before importing the api package
+DEBUG = os.getenv("FLASK_DEBUG") == "1"
 
 
 def create_response(
@@ -10,7 +15,7 @@ def create_response(
     message: str = "",
     error: Optional[str] = None,
     status_code: int = 200,
-) -> tuple:
+) -> Response:
     """
     Create a standardized API response
     """
@@ -19,15 +24,75 @@ def create_response(
     if error:
         response["error"] = error
 
-    return jsonify(response), status_code
+    body = orjson.dumps(response, option=orjson.OPT_NON_STR_KEYS)
+    return Response(body, status=status_code, mimetype="application/json")
+
+
+def static_response(
+    success: bool = True,
+    data: Any = None,
+    message: str = "",
+    error: Optional[str] = None,
+    status_code: int = 200,
+) -> Callable[[], Response]:
+    """
+    Pre-serialize a fixed API response and return a factory for it
+
+    The body is encoded once; each call only wraps it in a new Response, since
+    Response objects are mutable and must not be shared between requests.
+    """
+    payload = create_response(success, data, message, error, status_code).get_data()
+
+    def factory() -> Response:
+        return Response(payload, status=status_code, mimetype="application/json")
+
+    return factory
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson
+
+    Used by jsonify, request.get_json and anything else going through app.json,
+    so those paths match the encoding create_response already uses.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # Formatting options such as indent and sort_keys are ignored
+        return orjson.dumps(
+            obj, default=self.default, option=orjson.OPT_NON_STR_KEYS
+        ).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+
+# (whole second, formatted "YYYY-MM-DDTHH:MM:SS." prefix) of the last timestamp
+_timestamp_prefix = (None, "")
 
 
 def get_utc_timestamp() -> str:
     """Get current UTC timestamp in ISO format with milliseconds"""
-    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    global _timestamp_prefix
+
+    now = time.time()
+    second = int(now)
+    cached_second, prefix = _timestamp_prefix
+    if cached_second != second:
+        # Only format the date and time once per second
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S.", time.gmtime(second))
+        _timestamp_prefix = (second, prefix)
+    return f"{prefix}{int((now - second) * 1000):03d}Z"
 
 
-def debug_log(message: str) -> None:
-    """Print debug messages only when FLASK_DEBUG is enabled"""
-    if os.getenv("FLASK_DEBUG") == "1":
+# Chosen once at import so calls made with debugging off skip the flag check.
+# Expensive messages should still be built under `if DEBUG:` at the call site
+if DEBUG:
+
+    def debug_log(message: str) -> None:
+        """Print debug messages only when FLASK_DEBUG is enabled"""
         print(f"[DEBUG] {message}")
+
+else:
+
+    def debug_log(message: str) -> None:
+        """Print debug messages only when FLASK_DEBUG is enabled"""
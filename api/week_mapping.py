@@ -0,0 +1,137 @@
+from datetime import datetime
+from typing import NamedTuple, Tuple
+
+weekNumberMapping = [
+    {"weekCommencing": "2024-09-16", "weekEnding": "2024-09-22", "weekNumber": "F"},
+    {"weekCommencing": "2024-09-23", "weekEnding": "2024-09-29", "weekNumber": "1"},
+    {"weekCommencing": "2024-09-30", "weekEnding": "2024-10-06", "weekNumber": "2"},
+    {"weekCommencing": "2024-10-07", "weekEnding": "2024-10-13", "weekNumber": "3"},
+    {"weekCommencing": "2024-10-14", "weekEnding": "2024-10-20", "weekNumber": "4"},
+    {"weekCommencing": "2024-10-21", "weekEnding": "2024-10-27", "weekNumber": "5"},
+    {"weekCommencing": "2024-10-28", "weekEnding": "2024-11-03", "weekNumber": "C"},
+    {"weekCommencing": "2024-11-04", "weekEnding": "2024-11-10", "weekNumber": "6"},
+    {"weekCommencing": "2024-11-11", "weekEnding": "2024-11-17", "weekNumber": "7"},
+    {"weekCommencing": "2024-11-18", "weekEnding": "2024-11-24", "weekNumber": "8"},
+    {"weekCommencing": "2024-11-25", "weekEnding": "2024-12-01", "weekNumber": "9"},
+    {
+        "weekCommencing": "2024-12-02",
+        "weekEnding": "2024-12-08",
+        "weekNumber": "10",
+    },
+    {
+        "weekCommencing": "2024-12-09",
+        "weekEnding": "2024-12-15",
+        "weekNumber": "11",
+    },
+    {"weekCommencing": "2024-12-16", "weekEnding": "2024-12-22", "weekNumber": "V"},
+    {"weekCommencing": "2024-12-23", "weekEnding": "2024-12-29", "weekNumber": "V"},
+    {"weekCommencing": "2024-12-30", "weekEnding": "2025-01-05", "weekNumber": "V"},
+    {
+        "weekCommencing": "2025-01-06",
+        "weekEnding": "2025-01-12",
+        "weekNumber": "RV",
+    },
+    {
+        "weekCommencing": "2025-01-13",
+        "weekEnding": "2025-01-19",
+        "weekNumber": "RA",
+    },
+    {
+        "weekCommencing": "2025-01-20",
+        "weekEnding": "2025-01-26",
+        "weekNumber": "RA",
+    },
+    {
+        "weekCommencing": "2025-01-27",
+        "weekEnding": "2025-02-02",
+        "weekNumber": "RA",
+    },
+    {
+        "weekCommencing": "2025-02-03",
+        "weekEnding": "2025-02-09",
+        "weekNumber": "Rf",
+    },
+    {"weekCommencing": "2025-02-10", "weekEnding": "2025-02-16", "weekNumber": "1"},
+    {"weekCommencing": "2025-02-17", "weekEnding": "2025-02-23", "weekNumber": "2"},
+    {"weekCommencing": "2025-02-24", "weekEnding": "2025-03-02", "weekNumber": "3"},
+    {"weekCommencing": "2025-03-03", "weekEnding": "2025-03-09", "weekNumber": "4"},
+    {"weekCommencing": "2025-03-10", "weekEnding": "2025-03-16", "weekNumber": "5"},
+    {"weekCommencing": "2025-03-17", "weekEnding": "2025-03-23", "weekNumber": "6"},
+    {"weekCommencing": "2025-03-24", "weekEnding": "2025-03-30", "weekNumber": "7"},
+    {"weekCommencing": "2025-03-31", "weekEnding": "2025-04-06", "weekNumber": "8"},
+    {"weekCommencing": "2025-04-07", "weekEnding": "2025-04-13", "weekNumber": "V"},
+    {"weekCommencing": "2025-04-14", "weekEnding": "2025-04-20", "weekNumber": "V"},
+    {"weekCommencing": "2025-04-21", "weekEnding": "2025-04-27", "weekNumber": "9"},
+    {
+        "weekCommencing": "2025-04-28",
+        "weekEnding": "2025-05-04",
+        "weekNumber": "10",
+    },
+    {
+        "weekCommencing": "2025-05-05",
+        "weekEnding": "2025-05-11",
+        "weekNumber": "11",
+    },
+    {
+        "weekCommencing": "2025-05-12",
+        "weekEnding": "2025-05-18",
+        "weekNumber": "RV",
+    },
+    {
+        "weekCommencing": "2025-05-19",
+        "weekEnding": "2025-05-25",
+        "weekNumber": "RA",
+    },
+    {
+        "weekCommencing": "2025-05-26",
+        "weekEnding": "2025-06-01",
+        "weekNumber": "RA",
+    },
+    {
+        "weekCommencing": "2025-06-02",
+        "weekEnding": "2025-06-08",
+        "weekNumber": "RA",
+    },
+]
+
+
+def get_iso_week_number(date_str):
+    """
+    Convert a date string to ISO week number within the year.
+
+    Args:
+        date_str (str): Date string in format 'YYYY-MM-DD'
+
+    Returns:
+        tuple: (iso_year, week_number)
+    """
+    iso_year, week, _ = datetime.strptime(date_str, "%Y-%m-%d").isocalendar()
+    return iso_year, week
+
+
+class WeekEntry(NamedTuple):
+    """A week from weekNumberMapping with its ISO year and week precomputed"""
+
+    week_commencing: str
+    week_number: str
+    iso_year: int
+    iso_week: int
+
+
+def _build_week_table() -> Tuple[WeekEntry, ...]:
+    """Parse weekNumberMapping once into a table of WeekEntry rows"""
+    table = []
+    for week_data in weekNumberMapping:
+        iso_year, iso_week = get_iso_week_number(week_data["weekCommencing"])
+        table.append(
+            WeekEntry(
+                week_commencing=week_data["weekCommencing"],
+                week_number=week_data["weekNumber"],
+                iso_year=iso_year,
+                iso_week=iso_week,
+            )
+        )
+    return tuple(table)
+
+
+WEEK_TABLE = _build_week_table()
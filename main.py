@@ -1,21 +1,37 @@
-from flask import Flask, jsonify, send_from_directory, request
+from dotenv import load_dotenv
+
+# Load environment variables before importing modules that read them at import
+load_dotenv()
+
+from flask import Flask, Response, request
 from api.test_auth import auth_bp
-from api.utils import create_response, debug_log
-from api.middleware import check_api_key
+from api.utils import (
+    create_response,
+    static_response,
+    debug_log,
+    DEBUG,
+    OrjsonProvider,
+)
+from api.middleware import check_api_key, AUTH_ENABLED
 from api.state import state, connection_monitor
 from api.routes.user_routes import session_bp
 import threading
 import os
-from dotenv import load_dotenv
 import asyncio
+from datetime import datetime, timezone
 from scripts.auto_checkin_scheduler import start_scheduler
-from scripts.auto_attendance_scheduler import initialize_scheduler
-import time
-
-# Load environment variables
-load_dotenv()
+from scripts.auto_attendance_scheduler import (
+    supervise as supervise_attendance_scheduler,
+)
 
 app = Flask(__name__, static_folder="public", static_url_path="")
+app.json = OrjsonProvider(app)
+
+# Let browsers cache static assets (favicons etc.) for a day
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400
+
+# Seconds between state monitor checks (debug mode only)
+STATE_MONITOR_INTERVAL = 10
 
 
 def start_background_tasks():
@@ -37,69 +53,48 @@ def start_background_tasks():
     os.environ["BACKGROUND_TASKS_STARTED"] = "true"
 
     try:
-        # Start connection monitor in background thread
-        debug_log("Starting connection monitor...")
-        monitor_thread = threading.Thread(target=connection_monitor, daemon=True)
-        monitor_thread.start()
-        debug_log("Connection monitor started successfully")
-
-        # # Start state monitoring thread
-        # def monitor_state():
-        #     debug_log("State monitor started")
-        #     while True:
-        #         try:
-        #             debug_log("\n=== CURRENT STATE DATA ===")
-        #             debug_log(str(state.data))
-        #             debug_log("=========================\n")
-        #             time.sleep(10)
-        #         except Exception as e:
-        #             debug_log(f"Error in state monitor: {str(e)}")
-        #             time.sleep(5)  # Wait before retrying
-
-        # debug_log("Starting state monitor...")
-        # state_monitor_thread = threading.Thread(target=monitor_state, daemon=True)
-        # state_monitor_thread.start()
-        # debug_log("State monitor started successfully")
-
-        # Start auto checkin scheduler in background thread
-        def run_checkin_scheduler():
-            debug_log("Auto checkin scheduler thread starting...")
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                loop.run_until_complete(start_scheduler())
-            except Exception as e:
-                # debug_log(f"Error in checkin scheduler: {str(e)}")
-                debug_log("Error in checkin scheduler")
-            finally:
-                loop.close()
-
-        debug_log("Starting auto checkin scheduler...")
-        checkin_thread = threading.Thread(target=run_checkin_scheduler, daemon=True)
-        checkin_thread.start()
-        debug_log("Auto checkin scheduler started successfully")
-
-        # Start attendance scheduler in background thread
-        def run_attendance_scheduler():
-            debug_log("Attendance scheduler thread starting...")
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+        # Log the state whenever it changes, checked on the scheduler loop
+        async def monitor_state():
+            debug_log("State monitor started")
+            version = 0
             while True:
                 try:
-                    loop.run_until_complete(initialize_scheduler())
+                    # Only log when something actually changed
+                    if state.version != version:
+                        version = state.version
+                        debug_log("\n=== CURRENT STATE DATA ===")
+                        debug_log(str(state.get_snapshot()))
+                        debug_log("=========================\n")
                 except Exception as e:
-                    # debug_log(f"Error in attendance scheduler: {str(e)}")
-                    debug_log("Error in attendance scheduler")
-                    time.sleep(5)  # Wait before retrying
-                finally:
-                    loop.close()
-
-        debug_log("Starting attendance fetch scheduler...")
-        attendance_thread = threading.Thread(
-            target=run_attendance_scheduler, daemon=True
-        )
-        attendance_thread.start()
-        debug_log("Attendance scheduler started successfully")
+                    debug_log(f"Error in state monitor: {str(e)}")
+                await asyncio.sleep(STATE_MONITOR_INTERVAL)
+
+        # Run the connection monitor and both schedulers on one event loop
+        async def run_schedulers():
+            tasks = [
+                connection_monitor(),
+                start_scheduler(),
+                supervise_attendance_scheduler(),
+            ]
+            # Its output is debug-only, so don't schedule it otherwise
+            if DEBUG:
+                tasks.append(monitor_state())
+
+            # return_exceptions keeps one task failing from cancelling the others
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        def run_scheduler_loop():
+            debug_log("Scheduler thread starting...")
+            try:
+                asyncio.run(run_schedulers())
+            except Exception as e:
+                # debug_log(f"Error in scheduler loop: {str(e)}")
+                debug_log("Error in scheduler loop")
+
+        debug_log("Starting connection monitor and schedulers...")
+        scheduler_thread = threading.Thread(target=run_scheduler_loop, daemon=True)
+        scheduler_thread.start()
+        debug_log("Connection monitor and schedulers started successfully")
 
         debug_log("=== All background tasks started successfully ===\n")
 
@@ -119,20 +114,35 @@ except Exception as e:
     debug_log("Failed to start background tasks")
 
 
+# URL paths of the files in the public folder, listed once at startup so
+# requests don't stat the filesystem
+_STATIC_PATHS = frozenset(
+    "/" + name
+    for name in os.listdir(app.static_folder)
+    if os.path.isfile(os.path.join(app.static_folder, name))
+)
+
+
 # Register global authentication middleware
-@app.before_request
 def authenticate():
+    # CORS preflights never carry the API key, so let Flask answer them
+    if request.method == "OPTIONS":
+        return None
+
     # Skip authentication for static files
-    # if request.path.startswith('/'):
-    #     path = request.path[1:]  # Remove leading slash
-    #     if os.path.exists(os.path.join(app.static_folder, path)):
-    #         return None
+    if request.path in _STATIC_PATHS:
+        return None
 
     result = check_api_key()
     if result is not None:
         return result
 
 
+# In development there is nothing to check, so skip the hook altogether
+if AUTH_ENABLED:
+    app.before_request(authenticate)
+
+
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix="/api/v1/auth")
 app.register_blueprint(session_bp, url_prefix="/api/v1")
@@ -164,69 +174,90 @@ def internal_server_error(error):
 
 
 # Root endpoint
-@app.route("/")
-def index():
-    return create_response(
+_INDEX_ENDPOINTS = {
+    "auth_test": "/api/v1/auth/test",
+    "status": "/api/v1/status",
+    "state": "/api/v1/state",
+    "refresh": "/api/v1/refresh",
+    "refresh_session": "/api/v1/refresh-session/<email>",
+    "fetch_users": "/api/v1/fetch-users",
+    "codes": "/api/v1/codes",
+    "try_codes": "/api/v1/try-codes",
+}
+
+# The only dynamic part of these responses is the connection flag, so both
+# variants are serialized once up front
+_INDEX_RESPONSES = {
+    connected: static_response(
         message="Welcome to the AutoCheckin API",
         data={
             "version": "1.0",
-            "endpoints": {
-                "auth_test": "/api/v1/auth/test",
-                "status": "/api/v1/status",
-                "state": "/api/v1/state",
-                "refresh": "/api/v1/refresh",
-                "refresh_session": "/api/v1/refresh-session/<email>",
-                "fetch_users": "/api/v1/fetch-users",
-                "codes": "/api/v1/codes",
-                "try_codes": "/api/v1/try-codes",
-            },
-            "status": {"connected": state.is_connected()},
+            "endpoints": _INDEX_ENDPOINTS,
+            "status": {"connected": connected},
         },
     )
+    for connected in (True, False)
+}
+_STATUS_RESPONSES = {
+    connected: static_response(message="API Status", data={"connected": connected})
+    for connected in (True, False)
+}
+
+
+@app.route("/")
+def index():
+    return _INDEX_RESPONSES[state.is_connected()]()
 
 
 # Status endpoint
 @app.route("/api/v1/status")
 def status():
-    return create_response(
-        message="API Status", data={"connected": state.is_connected()}
-    )
+    return _STATUS_RESPONSES[state.is_connected()]()
 
 
 # Global state endpoint
-@app.route("/api/v1/state")
-def get_state():
-    stored_data = {
-        "last_users_fetch": state.get_data("last_users_fetch"),
-        "last_all_session_refresh": state.get_data("last_all_session_refresh"),
-        "last_individual_session_refresh": state.get_data(
-            "last_individual_session_refresh"
-        ),
-        "next_cycle_run_time": state.get_data("next_cycle_run_time"),
-        "last_attendance_fetch_run": state.get_data("last_attendance_fetch_run"),
-        "autoCheckinUsers": state.get_data("autoCheckinUsers"),
-    }
-    return create_response(
-        message="Global State",
-        data={"connected": state.is_connected(), "stored_data": stored_data},
-    )
+_STATE_KEYS = (
+    "last_users_fetch",
+    "last_all_session_refresh",
+    "last_individual_session_refresh",
+    "last_attendance_fetch_run",
+    "autoCheckinUsers",
+)
 
 
-# Serve favicon.ico from public folder
-@app.route("/favicon.ico")
-def favicon():
-    return send_from_directory(app.static_folder, "favicon.ico")
+# (state version, serialized body) of the last /api/v1/state response
+_state_response_cache = (None, b"")
 
 
-# Serve favicon.svg from public folder
-@app.route("/favicon.svg")
-def favicon_svg():
-    return send_from_directory(app.static_folder, "favicon.svg")
+@app.route("/api/v1/state")
+def get_state():
+    global _state_response_cache
+
+    # Read the version before the snapshot so a cached body is never older
+    # than the version it is stored under
+    version = state.version
+    cached_version, body = _state_response_cache
+    if cached_version != version:
+        # Read every field from the same snapshot so they are mutually consistent
+        snapshot = state.get_snapshot()
+        stored_data = {key: snapshot.get(key) for key in _STATE_KEYS}
+        # The scheduler stores a Unix timestamp; format it only when requested
+        next_run_epoch = snapshot.get("next_cycle_run_epoch")
+        stored_data["next_cycle_run_time"] = (
+            datetime.fromtimestamp(next_run_epoch, timezone.utc).isoformat()
+            if next_run_epoch is not None
+            else None
+        )
+        body = create_response(
+            message="Global State",
+            data={"connected": snapshot["connected"], "stored_data": stored_data},
+        ).get_data()
+        _state_response_cache = (version, body)
+    return Response(body, mimetype="application/json")
 
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
     host = os.getenv("HOST", "::")
-    debug = os.getenv("FLASK_DEBUG", "0") == "1"
 
-    app.run(host=host, port=port, debug=debug)
+    app.run(host=host, port=port, debug=DEBUG)
@@ -1,57 +1,141 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 from api.state import state
-from api.utils import get_utc_timestamp, debug_log
+from api.utils import get_utc_timestamp, debug_log, DEBUG
 from scripts.fetch_attendance import fetch_attendance_page
-from api.checkout_client import CheckOutClient
+from api.checkout_client import get_default_client
+
+# Maximum number of attendance pages fetched concurrently
+MAX_FETCH_WORKERS = 8
+
+# Maximum number of update-sync posts sent to the CheckOut API concurrently
+MAX_SYNC_WORKERS = 8
+
+# Serialises the read-compute-write of attendance data between concurrent fetches
+_state_update_lock = threading.Lock()
+
+
+# Minimum time between scheduled attendance fetches
+FETCH_INTERVAL = timedelta(days=1)
+
+# (last_attendance_fetch_run string, time.monotonic() at which a fetch is due)
+_next_fetch_due = (None, 0.0)
 
 
 def should_run_fetch() -> bool:
     """Check if attendance fetch should run based on last run time.
 
+    The stored timestamp is only parsed when it changes; otherwise the check is
+    a single comparison against the monotonic clock.
+
     Returns:
         bool: True if it's been more than 24 hours since last run or if no previous run exists.
     """
+    global _next_fetch_due
+
     last_run = state.get_data("last_attendance_fetch_run")
     if not last_run:
         return True
 
-    last_run_time = datetime.fromisoformat(last_run.replace("Z", "+00:00"))
-    now = datetime.now(last_run_time.tzinfo)
+    cached_run, due_at = _next_fetch_due
+    if cached_run != last_run:
+        last_run_time = datetime.fromisoformat(last_run.replace("Z", "+00:00"))
+        elapsed = datetime.now(last_run_time.tzinfo) - last_run_time
+        due_at = time.monotonic() + (FETCH_INTERVAL - elapsed).total_seconds()
+        _next_fetch_due = (last_run, due_at)
+
+    return time.monotonic() > due_at
+
+
+def resolve_year_week(year: Optional[int], week: Optional[int]) -> Tuple[int, int]:
+    """Use the provided year/week or default to the current ones.
+
+    Args:
+        year (int, optional): Requested year
+        week (int, optional): Requested week
+
+    Returns:
+        Tuple[int, int]: Year and week to fetch
+    """
+    # Use the ISO year alongside the ISO week, so late December / early
+    # January dates don't pair week 1 or 53 with the wrong year
+    iso_year, iso_week, _ = datetime.now().isocalendar()
+    current_year = year if year is not None else iso_year
+    current_week = week if week is not None else iso_week
+    return current_year, current_week
+
+
+def is_week_settled(user: Dict[str, Any], year: int, week: int) -> bool:
+    """Check whether a user's stored attendance for a week can no longer change.
+
+    A week is settled once it has been fetched and none of its activities are
+    still in the "unknown" state.
+
+    Args:
+        user: User dictionary containing sync attendance data
+        year: Academic year
+        week: Week number
 
-    return (now - last_run_time) > timedelta(days=1)
+    Returns:
+        bool: True if the stored week has activities and all have a final state
+    """
+    attendance_data = (user.get("sync") or {}).get("attendanceData") or {}
+    activities = (attendance_data.get(str(year)) or {}).get(str(week))
+    if not activities:
+        return False
+    return all(a.get("attendanceState") != "unknown" for a in activities)
 
 
 def update_user_attendance_data(
-    user: Dict[str, Any], year: int, week: int, activities: List[Dict[str, Any]]
+    user: Dict[str, Any],
+    year: int,
+    week: int,
+    activities: List[Dict[str, Any]],
+    sync: bool = True,
 ) -> Dict[str, Any]:
-    """Update a user's attendance data for a specific year and week.
+    """Return a copy of a user with attendance data stored for a year and week.
+
+    The given user and its nested sync data are left unmodified, so the result
+    can be published with state.update_users or state.update_user.
 
     Args:
         user: User dictionary containing sync and attendance data
         year: Academic year
         week: Week number
         activities: List of attendance activities to store
+        sync (bool): If True, send the updated data to the CheckOut API. Defaults to True.
 
     Returns:
-        Dict[str, Any]: Updated user dictionary with new attendance data
+        Dict[str, Any]: New user dictionary with the week's attendance data
     """
-    if "sync" not in user or user["sync"] is None:
-        user["sync"] = {}
+    sync_data = user.get("sync") or {}
+    # Nested year -> week layout is what the CheckOut update-sync API expects
+    attendance_data = sync_data.get("attendanceData") or {}
+    year_data = {**(attendance_data.get(str(year)) or {}), str(week): activities}
+    updated_user = {
+        **user,
+        "sync": {
+            **sync_data,
+            "attendanceData": {**attendance_data, str(year): year_data},
+        },
+    }
 
-    if "attendanceData" not in user["sync"]:
-        user["sync"]["attendanceData"] = {}
+    if sync:
+        sync_user_attendance_data(updated_user)
 
-    year_str = str(year)
-    week_str = str(week)
+    return updated_user
 
-    if year_str not in user["sync"]["attendanceData"]:
-        user["sync"]["attendanceData"][year_str] = {}
 
-    user["sync"]["attendanceData"][year_str][week_str] = activities
+def sync_user_attendance_data(user: Dict[str, Any]) -> None:
+    """Send a user's stored attendance data to the CheckOut API.
 
-    # Send the updated sync data to the CheckOutAPI
-    client = CheckOutClient()
+    Args:
+        user: User dictionary containing email and sync attendance data
+    """
+    client = get_default_client()
     sync_data = {
         "email": user["email"],
         "sync": {"attendanceData": user["sync"]["attendanceData"]},
@@ -62,11 +146,75 @@ def update_user_attendance_data(
     except Exception as e:
         debug_log(f"Failed to sync attendance data: {str(e)}")
 
-    return user
+
+def sync_users_attendance_data(email: Optional[str] = None) -> None:
+    """Send stored attendance data to the CheckOut API in one post per user.
+
+    Used after fetching several weeks with sync disabled, so each user's data is
+    posted once rather than once per week.
+
+    Args:
+        email (str, optional): Only sync this user. Defaults to all users.
+    """
+    if email is None:
+        users = state.get_data("autoCheckinUsers") or []
+    else:
+        user = state.get_user(email)
+        users = [user] if user is not None else []
+
+    sync_users_concurrently(
+        [user for user in users if (user.get("sync") or {}).get("attendanceData")]
+    )
+
+
+def sync_users_concurrently(users: List[Dict[str, Any]]) -> None:
+    """Send several users' stored attendance data to the CheckOut API at once.
+
+    Each user is still one update-sync post, but the posts share the client's
+    connection pool and run in parallel rather than back to back.
+
+    Args:
+        users: User dictionaries containing email and sync attendance data
+    """
+    if len(users) <= 1:
+        for user in users:
+            sync_user_attendance_data(user)
+        return
+
+    with ThreadPoolExecutor(max_workers=MAX_SYNC_WORKERS) as executor:
+        list(executor.map(sync_user_attendance_data, users))
+
+
+def fetch_user_activities(
+    user: Dict[str, Any], year: int, week: int
+) -> Optional[List[Dict[str, Any]]]:
+    """Fetch a single user's attendance activities for a specific year and week.
+
+    Only performs the network fetch so it can safely run on worker threads.
+
+    Args:
+        user: User dictionary containing email and checkintoken
+        year: Academic year
+        week: Week number
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: Parsed activities, or None if the fetch failed
+    """
+    if DEBUG:
+        debug_log(f"\nFetching attendance for {user['email']}")
+
+    _, activities = fetch_attendance_page(
+        user["checkintoken"], user["email"], year, week
+    )
+    if not activities:
+        debug_log(f"Failed to fetch activities")
+    elif DEBUG:
+        debug_log(f"Successfully fetched {len(activities)} activities")
+    return activities
 
 
 def fetch_all_users_attendance(
-    force_run: bool = False, year: int = None, week: int = None
+    force_run: bool = False, year: int = None, week: int = None, sync: bool = True
 ) -> None:
     """Fetch and update attendance data for all users in autoCheckinUsers.
 
@@ -74,9 +222,9 @@ def fetch_all_users_attendance(
         force_run (bool): If True, bypasses the should_run_fetch check. Defaults to False.
         year (int, optional): Specific year to fetch attendance for. Defaults to current year.
         week (int, optional): Specific week to fetch attendance for. Defaults to current week.
+        sync (bool): If True, send updated data to the CheckOut API. Defaults to True.
     """
     debug_log("\nStarting attendance fetch for all users")
-    state.dump_state()
 
     if not force_run and not should_run_fetch():
         debug_log("Skipping attendance fetch - last run was less than 24 hours ago")
@@ -85,50 +233,70 @@ def fetch_all_users_attendance(
     users = state.get_data("autoCheckinUsers") or []
     debug_log(f"Found {len(users)} users")
 
-    # Use provided year/week or default to current
-    current_year = year if year is not None else datetime.now().year
-    current_week = week if week is not None else datetime.now().isocalendar()[1]
+    current_year, current_week = resolve_year_week(year, week)
 
     debug_log(f"Fetching attendance for year {current_year}, week {current_week}")
 
-    updated_users = []
+    fetchable_users = []
     for user in users:
-        email = user.get("email")
-        token = user.get("checkintoken")
-
-        if not email or not token:
+        if not user.get("email") or not user.get("checkintoken"):
             debug_log(f"Skipping user - missing email or token")
-            updated_users.append(user)
             continue
+        if not force_run and is_week_settled(user, current_year, current_week):
+            debug_log(f"Skipping user - week already settled")
+            continue
+        fetchable_users.append(user)
 
-        debug_log(f"\nFetching attendance for {email}")
-
-        _, activities = fetch_attendance_page(token, email, current_year, current_week)
-        if activities:
-            debug_log(f"Successfully fetched {len(activities)} activities")
-            user_copy = user.copy()
-            updated_user = update_user_attendance_data(
-                user_copy, current_year, current_week, activities
+    # Fetch all pages concurrently, then apply the results in a single pass
+    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+        futures = {
+            user["email"]: executor.submit(
+                fetch_user_activities, user, current_year, current_week
             )
-            debug_log(f"Updated sync data for {email}")
-            updated_users.append(updated_user)
-        else:
-            debug_log(f"Failed to fetch activities")
-            updated_users.append(user)
+            for user in fetchable_users
+        }
+        fetched = {email: future.result() for email, future in futures.items()}
 
-    try:
-        state.set_data("autoCheckinUsers", updated_users)
-        state.set_data("last_attendance_fetch_run", get_utc_timestamp())
-        state.dump_state()
+    updated_users = []
 
-    except Exception as e:
-        debug_log(f"Error updating state: {str(e)}")
+    def apply_fetched(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Runs under the state's writer lock against the latest stored list,
+        # so writes made during the fetch are kept
+        updated_users.clear()
+        new_users = []
+        for user in users:
+            activities = fetched.get(user.get("email"))
+            if activities:
+                user = update_user_attendance_data(
+                    user, current_year, current_week, activities, sync=False
+                )
+                updated_users.append(user)
+            new_users.append(user)
+        return new_users
+
+    with _state_update_lock:
+        try:
+            state.update_users(
+                apply_fetched, {"last_attendance_fetch_run": get_utc_timestamp()}
+            )
+        except Exception as e:
+            debug_log(f"Error updating state: {str(e)}")
+        if DEBUG:
+            debug_log(f"Updated sync data for {len(updated_users)} users")
+
+    # Sync after the lock is released so the posts can overlap
+    if sync:
+        sync_users_concurrently(updated_users)
 
     debug_log("Attendance fetch complete")
 
 
 def fetch_user_attendance_by_email(
-    email: str, force_run: bool = False, year: int = None, week: int = None
+    email: str,
+    force_run: bool = False,
+    year: int = None,
+    week: int = None,
+    sync: bool = True,
 ) -> bool:
     """Fetch and update attendance data for a specific user by email.
 
@@ -137,6 +305,7 @@ def fetch_user_attendance_by_email(
         force_run (bool): If True, bypasses the should_run_fetch check. Defaults to False.
         year (int, optional): Specific year to fetch attendance for. Defaults to current year.
         week (int, optional): Specific week to fetch attendance for. Defaults to current week.
+        sync (bool): If True, send updated data to the CheckOut API. Defaults to True.
 
     Returns:
         bool: True if the fetch was successful, False otherwise
@@ -147,60 +316,44 @@ def fetch_user_attendance_by_email(
         debug_log("Skipping attendance fetch - last run was less than 24 hours ago")
         return False
 
-    users = state.get_data("autoCheckinUsers") or []
-    debug_log(f"Found {len(users)} users")
-
-    # Use provided year/week or default to current
-    current_year = year if year is not None else datetime.now().year
-    current_week = week if week is not None else datetime.now().isocalendar()[1]
+    current_year, current_week = resolve_year_week(year, week)
 
     debug_log(f"Fetching attendance for year {current_year}, week {current_week}")
 
-    user_found = False
-    updated_users = []
-
-    for user in users:
-        user_email = user.get("email")
-
-        if user_email != email:
-            updated_users.append(user)
-            continue
-
-        user_found = True
-        token = user.get("checkintoken")
-
-        if not token:
-            debug_log(f"Skipping user - missing token")
-            updated_users.append(user)
-            continue
-
-        debug_log(f"Fetching attendance for {email}")
-
-        _, activities = fetch_attendance_page(token, email, current_year, current_week)
-        if activities:
-            debug_log(f"Successfully fetched {len(activities)} activities")
-            user_copy = user.copy()
-            updated_user = update_user_attendance_data(
-                user_copy, current_year, current_week, activities
-            )
-            debug_log(f"Updated sync data for {email}")
-            updated_users.append(updated_user)
-        else:
-            debug_log(f"Failed to fetch activities")
-            updated_users.append(user)
-
-    if not user_found:
+    user = state.get_user(email)
+    if user is None:
         debug_log(f"User with email {email} not found")
         return False
 
-    try:
-        state.set_data("autoCheckinUsers", updated_users)
-        state.set_data("last_attendance_fetch_run", get_utc_timestamp())
-        state.dump_state()
-        return True
-    except Exception as e:
-        debug_log(f"Error updating state: {str(e)}")
-        return False
+    activities = None
+    if user.get("checkintoken"):
+        activities = fetch_user_activities(user, current_year, current_week)
+    else:
+        debug_log(f"Skipping user - missing token")
+
+    updated_user = None
+    with _state_update_lock:
+        # Look the user up again in case the list was replaced during the fetch
+        stored_user = state.get_user(email)
+        try:
+            if activities and stored_user is not None:
+                updated_user = update_user_attendance_data(
+                    stored_user, current_year, current_week, activities, sync=False
+                )
+                state.update_user(email, {"sync": updated_user["sync"]})
+                if DEBUG:
+                    debug_log(f"Updated sync data for {email}")
+
+            state.update({"last_attendance_fetch_run": get_utc_timestamp()})
+        except Exception as e:
+            debug_log(f"Error updating state: {str(e)}")
+            return False
+
+    # Post outside the lock so a slow CheckOut API doesn't hold up other fetches
+    if sync and updated_user is not None:
+        sync_user_attendance_data(updated_user)
+
+    return True
 
 
 if __name__ == "__main__":
@@ -7,20 +7,33 @@ from scripts.attendance_scheduler import fetch_all_users_attendance
 INITIAL_DELAY_SECONDS = 5
 RUN_INITIAL_CYCLE = False
 
+# Seconds between checks for whether an attendance fetch is due
+CHECK_INTERVAL_SECONDS = 3600
+
+# Delays before restarting the scheduler after a crash, by consecutive failures
+RESTART_BACKOFF_SECONDS = (0.1, 0.5, 1, 5)
+
+# Number of scheduler ticks completed, so supervise can tell whether the
+# scheduler made progress before it crashed
+_completed_ticks = 0
+
 
 async def start_attendance_scheduler() -> None:
     """Run the attendance fetch scheduler continuously using asyncio.
 
     Fetches attendance data every hour, but the actual fetch operation
-    only runs if 24 hours have passed since the last run.
+    only runs if 24 hours have passed since the last run. The fetch blocks,
+    so it runs in a worker thread to keep the shared event loop responsive.
     """
+    global _completed_ticks
+
     debug_log("Attendance fetch scheduler is now running")
     await asyncio.sleep(INITIAL_DELAY_SECONDS)
 
     if RUN_INITIAL_CYCLE:
         debug_log("Running initial attendance fetch cycle")
         try:
-            fetch_all_users_attendance()
+            await asyncio.to_thread(fetch_all_users_attendance)
         except Exception as e:
             # debug_log(f"Error in initial attendance fetch cycle: {str(e)}")
             debug_log("Error in initial attendance fetch cycle")
@@ -30,19 +43,28 @@ async def start_attendance_scheduler() -> None:
     initial_delay = (next_hour - now).total_seconds()
 
     # debug_log(f"Next attendance fetch scheduled for: {next_hour.isoformat()}")
-    await asyncio.sleep(initial_delay)
+
+    # Ticks are anchored to the loop's monotonic clock so the time spent
+    # fetching doesn't push every later run back
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time() + initial_delay
 
     while True:
+        await asyncio.sleep(next_tick - loop.time())
+
         try:
             debug_log("Running attendance fetch cycle")
-            fetch_all_users_attendance()
+            await asyncio.to_thread(fetch_all_users_attendance)
         except Exception as e:
             # debug_log(f"Error in attendance fetch scheduler: {str(e)}")
             debug_log("Error in attendance fetch scheduler")
 
-        next_run = datetime.now() + timedelta(hours=1)
-        # debug_log(f"Next attendance fetch scheduled for: {next_run.isoformat()}")
-        await asyncio.sleep(3600)
+        _completed_ticks += 1
+
+        # Skip any ticks missed while a slow fetch was running
+        next_tick += CHECK_INTERVAL_SECONDS
+        while next_tick <= loop.time():
+            next_tick += CHECK_INTERVAL_SECONDS
 
 
 async def initialize_scheduler() -> None:
@@ -51,12 +73,31 @@ async def initialize_scheduler() -> None:
     await start_attendance_scheduler()
 
 
+async def supervise() -> None:
+    """Run the attendance scheduler, restarting it in the same loop if it fails.
+
+    Restarts quickly at first and backs off while the errors persist.
+    """
+    failures = 0
+    while True:
+        completed = _completed_ticks
+        try:
+            await initialize_scheduler()
+        except Exception as e:
+            # debug_log(f"Error in attendance scheduler: {str(e)}")
+            debug_log("Error in attendance scheduler")
+            # A crash after a completed tick starts the backoff over
+            if _completed_ticks != completed:
+                failures = 0
+            delay = RESTART_BACKOFF_SECONDS[
+                min(failures, len(RESTART_BACKOFF_SECONDS) - 1)
+            ]
+            failures += 1
+            await asyncio.sleep(delay)
+
+
 if __name__ == "__main__":
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
     try:
-        loop.run_until_complete(initialize_scheduler())
+        asyncio.run(initialize_scheduler())
     except KeyboardInterrupt:
         debug_log("Attendance scheduler stopped by user")
-    finally:
-        loop.close()
@@ -2,10 +2,9 @@ import time
 import random
 from typing import List, Dict, Any
 import asyncio
-from datetime import datetime, timezone, timedelta
 import os
 from api.state import state
-from api.utils import get_utc_timestamp, debug_log
+from api.utils import get_utc_timestamp, debug_log, DEBUG
 from scripts.session_refresh import refresh_session_token, log
 
 # Scheduler Configuration Constants
@@ -29,6 +28,13 @@ MAX_SECONDS_BETWEEN_RUNS = 18000  # 5 hours
 MIN_USER_DELAY_MS = 0
 MAX_USER_DELAY_MS = 600000  # 10 minutes max delay between users for stealth
 
+# Delays before restarting the scheduler after a crash, by consecutive failures
+RESTART_BACKOFF_SECONDS = (1, 5, 30, 60, 300)
+
+# Number of checkin cycles completed, so start_scheduler can tell whether
+# the scheduler made progress before it crashed
+_completed_cycles = 0
+
 
 def get_users() -> List[Dict[str, Any]]:
     """Retrieve the list of users configured for automatic check-ins from global state.
@@ -40,6 +46,26 @@ def get_users() -> List[Dict[str, Any]]:
     return state.get_data("autoCheckinUsers") or []
 
 
+def schedule_next_cycle() -> float:
+    """Pick a random delay before the next check-in cycle and record it in state.
+
+    The run time is stored as a Unix timestamp (next_cycle_run_epoch); it is
+    only formatted when the state endpoint is requested.
+
+    Returns:
+        float: Seconds to wait before the next cycle
+    """
+    next_run_seconds = (
+        random.randint(
+            int(MIN_SECONDS_BETWEEN_RUNS * 1000),
+            int(MAX_SECONDS_BETWEEN_RUNS * 1000),
+        )
+        / 1000
+    )
+    state.set_data("next_cycle_run_epoch", time.time() + next_run_seconds)
+    return next_run_seconds
+
+
 async def run_autocheckin(user: Dict[str, Any]) -> None:
     """Process automatic check-in for a single user by refreshing their session token.
 
@@ -63,29 +89,22 @@ async def run_autocheckin(user: Dict[str, Any]) -> None:
 
     debug_log(f"Running auto checkin for {email}")
 
-    new_token = refresh_session_token(email, token)
-    users = state.get_data("autoCheckinUsers") or []
+    # The refresh is a blocking HTTP call; keep it off the shared event loop
+    new_token = await asyncio.to_thread(refresh_session_token, email, token)
     current_time = get_utc_timestamp()
 
-    for stored_user in users:
-        if stored_user.get("email") == email:
-            if new_token:
-                debug_log(f"Token refresh successful for {email}")
-                stored_user.update(
-                    {
-                        "checkintoken": new_token,
-                        "checkinReport": "Normal",
-                        "checkinReportTime": current_time,
-                    }
-                )
-            else:
-                debug_log(f"Token refresh failed for {email}")
-                stored_user.update(
-                    {"checkinReport": "Fail", "checkinReportTime": current_time}
-                )
-            break
-
-    state.set_data("autoCheckinUsers", users)
+    if new_token:
+        debug_log(f"Token refresh successful for {email}")
+        values = {
+            "checkintoken": new_token,
+            "checkinReport": "Normal",
+            "checkinReportTime": current_time,
+        }
+    else:
+        debug_log(f"Token refresh failed for {email}")
+        values = {"checkinReport": "Fail", "checkinReportTime": current_time}
+
+    state.update_user(email, values)
 
 
 async def start_autocheckin_cycle() -> None:
@@ -99,6 +118,8 @@ async def start_autocheckin_cycle() -> None:
     The function runs indefinitely until interrupted, maintaining the check-in schedule.
     Updates the next scheduled run time in global state for monitoring.
     """
+    global _completed_cycles
+
     debug_log("\nStarting auto checkin scheduler")
     # debug_log(f"Initial delay: {INITIAL_DELAY_SECONDS} seconds")
     # debug_log(f"Run initial cycle: {RUN_INITIAL_CYCLE}")
@@ -107,53 +128,42 @@ async def start_autocheckin_cycle() -> None:
 
     if not RUN_INITIAL_CYCLE:
         # Calculate and wait for first run if not running immediately
-        next_run_ms = (
-            random.randint(
-                int(MIN_SECONDS_BETWEEN_RUNS * 1000),
-                int(MAX_SECONDS_BETWEEN_RUNS * 1000),
-            )
-            / 1000
-        )
-        next_run_seconds = next_run_ms
-        next_run_time = datetime.now(timezone.utc) + timedelta(seconds=next_run_seconds)
-        state.set_data("next_cycle_run_time", next_run_time.isoformat())
+        next_run_seconds = schedule_next_cycle()
         # debug_log(f"Waiting {next_run_seconds:.2f} seconds before first cycle")
-        # debug_log(f"Next run scheduled for: {next_run_time.isoformat()}")
         await asyncio.sleep(next_run_seconds)
 
     while True:
         debug_log("\nStarting new auto checkin cycle")
 
-        # Get and shuffle users for random processing order
+        # Visit users in a random order; shuffle indices rather than the
+        # list itself, since get_users returns the list held in global state
         users = get_users()
-        random.shuffle(users)
+        order = list(range(len(users)))
+        random.shuffle(order)
 
-        debug_log(f"Processing {len(users)} users")
+        # Draw the random delay before each user up front, which also gives
+        # the length of the whole cycle before it starts
+        delays_sec = [
+            random.randint(MIN_USER_DELAY_MS, int(MAX_USER_DELAY_MS)) / 1000
+            for _ in order
+        ]
 
-        for user in users:
-            # Add random delay between processing each user
-            delay_ms = random.randint(MIN_USER_DELAY_MS, int(MAX_USER_DELAY_MS))
-            delay_sec = delay_ms / 1000
+        debug_log(f"Processing {len(users)} users")
+        if DEBUG:
+            debug_log(f"Cycle will take at least {sum(delays_sec):.2f} seconds")
 
+        for i, delay_sec in zip(order, delays_sec):
             # debug_log(f"Waiting {delay_sec:.2f} seconds before processing next user")
             await asyncio.sleep(delay_sec)
 
-            await run_autocheckin(user)
+            await run_autocheckin(users[i])
+
+        _completed_cycles += 1
 
         # Schedule next cycle with random delay
-        next_run_ms = (
-            random.randint(
-                int(MIN_SECONDS_BETWEEN_RUNS * 1000),
-                int(MAX_SECONDS_BETWEEN_RUNS * 1000),
-            )
-            / 1000
-        )
-        next_run_seconds = next_run_ms
-        next_run_time = datetime.now(timezone.utc) + timedelta(seconds=next_run_seconds)
-        state.set_data("next_cycle_run_time", next_run_time.isoformat())
+        next_run_seconds = schedule_next_cycle()
 
         # debug_log(f"Cycle complete. Waiting {next_run_seconds:.2f} seconds before next cycle")
-        # debug_log(f"Next run scheduled for: {next_run_time.isoformat()}")
         await asyncio.sleep(next_run_seconds)
 
 
@@ -166,12 +176,25 @@ async def start_scheduler() -> None:
 
     Note: This function will run indefinitely until the program is terminated.
     """
-    try:
-        await start_autocheckin_cycle()
-    except Exception as e:
-        # debug_log(f"Error in auto checkin scheduler: {str(e)}")
-        debug_log("Error in auto checkin scheduler")
-        await start_scheduler()
+    failures = 0
+    while True:
+        completed = _completed_cycles
+        try:
+            await start_autocheckin_cycle()
+            return
+        except Exception as e:
+            # debug_log(f"Error in auto checkin scheduler: {str(e)}")
+            debug_log("Error in auto checkin scheduler")
+            # A crash after a completed cycle starts the backoff over
+            if _completed_cycles != completed:
+                failures = 0
+            # Restart in this loop rather than recursively, backing off while
+            # the errors persist
+            delay = RESTART_BACKOFF_SECONDS[
+                min(failures, len(RESTART_BACKOFF_SECONDS) - 1)
+            ]
+            failures += 1
+            await asyncio.sleep(delay)
 
 
 if __name__ == "__main__":
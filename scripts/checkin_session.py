@@ -0,0 +1,83 @@
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from typing import Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connections kept open to the checkin portal; sized for the concurrent
+# attendance fetches, session refreshes and code submissions
+POOL_MAXSIZE = 32
+
+# Seconds to wait for the checkin portal to connect or respond; the session
+# has no default, so pass it with every request
+TIMEOUT = int(os.getenv("REQUESTS_TIMEOUT", "10"))
+
+# Longest Retry-After honoured, so a rate limit can't park a worker thread
+MAX_RETRY_AFTER = 30
+
+# Statuses at which the portal has refused a POST without processing it
+_POST_RETRY_STATUSES = frozenset({429, 503})
+
+
+class _CheckinRetry(Retry):
+    """Retry that never replays a POST the portal may already have processed"""
+
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        # A 502/504 from the gateway can arrive after the code was submitted
+        if method == "POST" and status_code not in _POST_RETRY_STATUSES:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER)
+
+
+# Retry rate limiting and gateway errors with backoff. Other statuses, such as
+# the 422 for an invalid code, are final and returned straight away. POST is
+# only retried when the portal refused it, so a transient error doesn't use up
+# a code attempt. Read errors are never retried, since the request may have
+# been processed
+RETRY = _CheckinRetry(
+    total=3,
+    read=0,
+    backoff_factor=0.3,
+    status_forcelist=[429, 502, 503, 504],
+    allowed_methods=frozenset({"GET", "POST"}),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_checkin_session() -> requests.Session:
+    """
+    Return the shared requests session used for calls to the checkin portal
+
+    Keeps connections to the portal alive between requests so concurrent
+    fetches reuse TLS connections instead of opening one per call. Every
+    request is made on behalf of a different user with its own session
+    cookie header, so the session's cookie jar is disabled to stop cookies
+    set for one user being sent with another user's requests.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=RETRY
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
@@ -1,64 +1,122 @@
 from typing import List, Dict, Any, Optional
 import os
-import requests
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from api.state import state
-from api.checkout_client import CheckOutClient, CheckOutAPIError
+from api.checkout_client import get_default_client, CheckOutAPIError
 from scripts.session_refresh import refresh_session_token, log
-from api.utils import get_utc_timestamp, debug_log
+from scripts.checkin_session import get_checkin_session, TIMEOUT
+from api.utils import get_utc_timestamp, debug_log, DEBUG
+from api.cache import ttl_cache
 
 # Get the checkin URL from environment variables
 CHECKIN_URL = os.getenv("CHECKIN_URL", "https://checkin.york.ac.uk")
 
+# Maximum number of users processed concurrently by try_codes_for_all_users
+MAX_USER_WORKERS = 8
 
-def get_codes() -> List[str]:
-    """Fetch and sort available checkin codes from the CheckOut API.
+# Number of codes submitted at once for an event, taken in reputation order
+CODES_PER_BATCH = 3
 
-    Retrieves all available codes from active sessions and sorts them by reputation score,
-    which is based on successful usage count.
+# Event statuses that mean the user is already checked in
+PRESENT_STATUSES = frozenset({"Present", "Present Late"})
+
+# Headers sent with every code submission; only the cookie varies per call
+_TRY_CODE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0",
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
+    "Referer": f"{CHECKIN_URL}/selfregistration",
+}
+
+# (codes list it was built from, alphabetically sorted copy) for get_sorted_codes
+_sorted_codes_cache = (None, [])
+
+
+@ttl_cache(ttl=10)
+def fetch_codes() -> List[str]:
+    """Fetch available checkin codes from the CheckOut API, sorted by reputation.
+
+    Results are cached for a few seconds since the same codes are requested by
+    every user in a submission run.
 
     Returns:
         List[str]: List of checkin codes sorted by reputation score (most successful first).
+
+    Raises:
+        CheckOutAPIError: If the request to the CheckOut API fails
     """
     debug_log("\nFetching codes from CheckOut API")
 
-    try:
-        client = CheckOutClient()
-        response = client.get("codes/yrk/cs/2")
+    client = get_default_client()
+    response = client.get("codes/yrk/cs/2")
+
+    debug_log("Parsing response from CheckOut API")
 
-        debug_log("Parsing response from CheckOut API")
+    if response.get("status_code") == 403:
+        debug_log("Access forbidden")
+        return []
+
+    session_count = response.get("sessionCount", 0)
+    if not session_count:
+        debug_log("No active sessions found")
+        return []
 
-        if response.get("status_code") == 403:
-            debug_log("Access forbidden")
-            return []
+    codes = []
+    sessions = response.get("sessions", [])
 
-        session_count = response.get("sessionCount", 0)
-        if not session_count:
-            debug_log("No active sessions found")
-            return []
+    debug_log(f"Found {len(sessions)} sessions")
 
-        codes = []
-        sessions = response.get("sessions", [])
+    for session in sessions:
+        session_codes = session.get("codes", [])
+        codes.extend(session_codes)
 
-        debug_log(f"Found {len(sessions)} sessions")
+    # Sort by reputation score (usage count)
+    codes.sort(key=lambda x: x.get("count", 0), reverse=True)
+    sorted_checkin_codes = [str(code.get("checkinCode")) for code in codes]
 
-        for session in sessions:
-            session_codes = session.get("codes", [])
-            codes.extend(session_codes)
+    debug_log(f"Extracted {len(sorted_checkin_codes)} codes")
 
-        # Sort by reputation score (usage count)
-        codes.sort(key=lambda x: x.get("count", 0), reverse=True)
-        sorted_checkin_codes = [str(code.get("checkinCode")) for code in codes]
+    return sorted_checkin_codes
+
+
+def get_codes() -> List[str]:
+    """Fetch and sort available checkin codes from the CheckOut API.
 
-        debug_log(f"Extracted {len(sorted_checkin_codes)} codes")
+    Retrieves all available codes from active sessions and sorts them by reputation score,
+    which is based on successful usage count.
 
-        return sorted_checkin_codes
+    Returns:
+        List[str]: List of checkin codes sorted by reputation score (most successful first).
+    """
+    try:
+        return fetch_codes()
 
     except CheckOutAPIError as e:
         debug_log(f"Error fetching codes: {str(e)}")
         return []
 
 
+def get_sorted_codes() -> List[str]:
+    """Get available checkin codes in alphabetical order.
+
+    The sorted copy is rebuilt only when fetch_codes produces a new result, so
+    repeated calls within the cache TTL don't re-sort the same list.
+
+    Returns:
+        List[str]: List of checkin codes sorted alphabetically.
+    """
+    global _sorted_codes_cache
+
+    codes = get_codes()
+    source, sorted_codes = _sorted_codes_cache
+    if source is not codes:
+        sorted_codes = sorted(codes)
+        _sorted_codes_cache = (codes, sorted_codes)
+    return sorted_codes
+
+
 def try_code(event_id: str, code: str, session_token: str, csrf_token: str) -> bool:
     """Attempt to use a checkin code for a specific event.
 
@@ -73,15 +131,12 @@ def try_code(event_id: str, code: str, session_token: str, csrf_token: str) -> b
     Returns:
         bool: True if code was accepted, False if invalid or error occurred
     """
-    debug_log(f"\nTrying code for event {event_id}")
-    debug_log(f"Code: {code}")
+    if DEBUG:
+        debug_log(f"\nTrying code for event {event_id}")
+        debug_log(f"Code: {code}")
 
     headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:123.0) Gecko/20100101 Firefox/123.0",
-        "Accept": "application/json",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Content-Type": "application/x-www-form-urlencoded; charset=UTF-8",
-        "Referer": f"{CHECKIN_URL}/selfregistration",
+        **_TRY_CODE_HEADERS,
         "Cookie": f"XSRF-TOKEN={csrf_token}; prestostudent_session={session_token}",
     }
 
@@ -91,35 +146,80 @@ def try_code(event_id: str, code: str, session_token: str, csrf_token: str) -> b
     }
 
     try:
-        response = requests.post(
+        response = get_checkin_session().post(
             f"{CHECKIN_URL}/api/selfregistration/{event_id}/present",
             headers=headers,
             data=data,
+            timeout=TIMEOUT,
         )
 
-        debug_log(f"Response status code: {response.status_code}")
+        if DEBUG:
+            debug_log(f"Response status code: {response.status_code}")
 
         if response.status_code == 422:  # Invalid code
             debug_log("Invalid code")
             return False
 
         if response.status_code != 200:
-            debug_log(f"Error response: {response.text}")
+            # Decoding the body is only worth it when it will be printed
+            if DEBUG:
+                debug_log(f"Error response: {response.text}")
             return False
 
         debug_log("Code accepted successfully")
         return True
 
     except Exception as e:
-        debug_log(f"Error trying code: {str(e)}")
+        if DEBUG:
+            debug_log(f"Error trying code: {str(e)}")
         return False
 
 
-def try_codes_for_user(email: str, current_token: str) -> None:
+def try_codes_for_event(
+    event_id: str,
+    codes: List[str],
+    session_token: str,
+    csrf_token: str,
+    executor: ThreadPoolExecutor,
+) -> Optional[str]:
+    """Try codes for an event until one is accepted.
+
+    Codes are submitted CODES_PER_BATCH at a time, most reputable first, and
+    the first accepted code ends the search without waiting for the rest of
+    its batch.
+
+    Args:
+        event_id: ID of the event to try the codes for
+        codes: Checkin codes sorted by reputation score
+        session_token: Current session token for authentication
+        csrf_token: CSRF token for request validation
+        executor: Pool the submissions run on, shared across a user's events
+
+    Returns:
+        Optional[str]: The accepted code, or None if no code was accepted
+    """
+    for start in range(0, len(codes), CODES_PER_BATCH):
+        futures = {
+            executor.submit(try_code, event_id, code, session_token, csrf_token): code
+            for code in codes[start : start + CODES_PER_BATCH]
+        }
+        for future in as_completed(futures):
+            if future.result():
+                # Return as soon as a code is accepted rather than waiting on
+                # the others; any not yet started are dropped
+                for other in futures:
+                    other.cancel()
+                return futures[future]
+    return None
+
+
+def try_codes_for_user(
+    email: str, current_token: str, codes: Optional[List[str]] = None
+) -> None:
     """Process checkin codes for all unchecked events of a user.
 
     For each event where the user is not marked as present:
-    1. Tries each available code in order of reputation score
+    1. Tries the available codes in order of reputation score, a few at a time
     2. Stops trying codes for an event once one succeeds
     3. Logs successful checkins to the system
     4. Updates the stored session token in global state
@@ -127,6 +227,8 @@ def try_codes_for_user(email: str, current_token: str) -> None:
     Args:
         email: User's email address
         current_token: User's current session token
+        codes: Checkin codes sorted by reputation score. Fetched from the
+            CheckOut API if not given.
     """
     debug_log(f"\nStarting code submission for {email}")
 
@@ -139,41 +241,45 @@ def try_codes_for_user(email: str, current_token: str) -> None:
     csrf_token = result["csrf_token"]
 
     # Update the stored session token in global state
-    stored_users = state.get_data("autoCheckinUsers") or []
-    for user in stored_users:
-        if user.get("email") == email:
-            user["checkintoken"] = new_token
-            user["checkinReportTime"] = get_utc_timestamp()
-            break
-    state.set_data("autoCheckinUsers", stored_users)
+    state.update_user(
+        email, {"checkintoken": new_token, "checkinReportTime": get_utc_timestamp()}
+    )
 
     debug_log(f"CSRF token: {csrf_token}")
     events = result["events"]
 
     debug_log(f"Found {len(events)} events")
 
-    codes = get_codes()
+    pending_events = [
+        event for event in events if event["status"] not in PRESENT_STATUSES
+    ]
+    if not pending_events:
+        # Nothing to check into, so don't fetch codes at all
+        debug_log("All events already present")
+        return
+
+    if codes is None:
+        codes = get_codes()
     if not codes:
         debug_log("No codes available")
         return
 
-    for event in events:
-        if event["status"] in ["Present", "Present Late"]:
-            debug_log(f"Skipping event {event['activity']} - already present")
-            continue
-
-        debug_log(f"\nProcessing event: {event['activity']}")
+    # One pool for all of this user's events rather than one per event
+    with ThreadPoolExecutor(max_workers=CODES_PER_BATCH) as executor:
+        for event in pending_events:
+            if DEBUG:
+                debug_log(f"\nProcessing event: {event['activity']}")
 
-        for code in codes:
-            success = try_code(event["id"], code, new_token, csrf_token)
-            if success:
+            code = try_codes_for_event(
+                event["id"], codes, new_token, csrf_token, executor
+            )
+            if code is not None:
                 debug_log(f"Successfully checked into {event['activity']}")
                 log(
                     email,
                     "Checkin",
                     f"Checked into {event['activity']} with code {code}",
                 )
-                break
 
 
 def try_codes_for_all_users() -> Dict[str, Any]:
@@ -190,17 +296,25 @@ def try_codes_for_all_users() -> Dict[str, Any]:
     users = state.get_data("autoCheckinUsers") or []
     debug_log(f"Found {len(users)} users")
 
+    # Every user tries the same codes, so fetch them once for the whole run
+    codes = get_codes()
+
     processed = 0
-    for user in users:
-        email = user.get("email")
-        token = user.get("checkintoken")
+    with ThreadPoolExecutor(max_workers=MAX_USER_WORKERS) as executor:
+        futures = []
+        for user in users:
+            email = user.get("email")
+            token = user.get("checkintoken")
+
+            if not email or not token:
+                debug_log("Skipping user - missing email or token")
+                continue
 
-        if not email or not token:
-            debug_log("Skipping user - missing email or token")
-            continue
+            futures.append(executor.submit(try_codes_for_user, email, token, codes))
 
-        try_codes_for_user(email, token)
-        processed += 1
+        for future in futures:
+            future.result()
+            processed += 1
 
     result = {
         "total_users": len(users),
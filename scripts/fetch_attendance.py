@@ -1,66 +1,136 @@
 import os
+from functools import lru_cache
 from typing import Optional, Dict, List, Tuple
-import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
+from lxml import etree, html
 from api.utils import debug_log
+from scripts.checkin_session import get_checkin_session, TIMEOUT
 
 # Get the checkin URL from environment variables
 CHECKIN_URL = os.getenv("CHECKIN_URL", "https://checkin.york.ac.uk")
 
+# Format of the activity dates on the page once the day name is removed and
+# the year is appended, e.g. "17 February 2025"
+DATE_FORMAT = "%d %B %Y"
+
+# Attendance state for each activity status class; anything else is "unknown"
+_STATUS_MAP = {
+    "activity-status-present": "present",
+    "activity-status-absent-unapproved": "absent",
+    "activity-status-undetermined": "unknown",
+}
+
+
+def _has_class(name: str) -> str:
+    """XPath predicate matching elements whose class list contains name"""
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+# XPath queries for the attendance page, compiled once at import
+_TITLE = etree.XPath("string(//title)")
+_PAGE_EMAIL = etree.XPath('//span[@class="side-menu-title side-menu-name"][1]')
+_ACTIVITY_LINES = etree.XPath(f"//article[{_has_class('activity-line-item')}]")
+_LINE_DATE = etree.XPath(f".//div[{_has_class('activity-line-date')}][1]")
+_LINE_SECTIONS = etree.XPath(f".//section[{_has_class('activity-line-action')}]")
+_REFERENCE = etree.XPath(f"(.//div[{_has_class('cont-in')}])[1]/text()[1]")
+_TIME = etree.XPath(f"(.//div[{_has_class('time')}])[1]")
+_STATUS_CLASS = etree.XPath(f"(.//div[{_has_class('activity-status')}])[1]/@class")
+_META = etree.XPath(f"(.//ul[{_has_class('meta')}])[1]//li[1]")
+
+
+def _stripped_text(element: html.HtmlElement) -> str:
+    """Join an element's text with each piece stripped, like get_text(strip=True)"""
+    return "".join(text.strip() for text in element.itertext())
+
+
+@lru_cache(maxsize=256)
+def _parse_date(date_without_day: str, year: int) -> Optional[str]:
+    """Format a page date such as "17 February" as YYYY-MM-DD.
+
+    A week's activities share a handful of dates, so results are cached rather
+    than running strptime for every activity.
+
+    Args:
+        date_without_day: The date with the day name removed
+        year: The year of the activity
+
+    Returns:
+        Optional[str]: The formatted date, or None if it could not be parsed
+    """
+    try:
+        parsed_date = datetime.strptime(f"{date_without_day} {year}", DATE_FORMAT)
+    except ValueError:
+        return None
+    return parsed_date.strftime("%Y-%m-%d")
+
+
+def _calendar_year(date_without_day: str, year: int, week: Optional[int]) -> int:
+    """Work out the calendar year of a date shown on an ISO week's page.
+
+    Pages are requested by ISO year and week, so week 1 can start in the
+    previous December and week 52/53 can end in the following January.
+
+    Args:
+        date_without_day: The date with the day name removed (e.g., "30 December")
+        year: The ISO year of the page
+        week: The ISO week of the page, if known
+
+    Returns:
+        int: The calendar year the date falls in
+    """
+    if week == 1 and date_without_day.endswith("December"):
+        return year - 1
+    if week is not None and week >= 52 and date_without_day.endswith("January"):
+        return year + 1
+    return year
+
 
 def parse_activity(
-    activity_section: BeautifulSoup, date: str, year: int
+    activity_section: html.HtmlElement,
+    date: Optional[str],
+    year: int,
+    week: Optional[int] = None,
 ) -> Dict[str, Optional[str]]:
     """Parse a single activity section from the attendance page.
 
     Args:
-        activity_section: BeautifulSoup object containing a single activity
+        activity_section: lxml element containing a single activity
         date: The date of the activity (e.g., "Monday 17 February")
-        year: The year of the activity
+        year: The ISO year of the page the activity is on
+        week: The ISO week of the page, used to place dates at the turn of the year
 
     Returns:
         Dict containing activity details including reference, location,
         lecturer name, start/finish times, attendance state, and formatted date (YYYY-MM-DD)
     """
-    # Get activity reference (name)
-    cont_in_div = activity_section.find("div", {"class": "cont-in"})
-    # Get only the text content before the meta list
-    activity_reference = cont_in_div.find(text=True, recursive=False).strip()
+    # Get activity reference (name): only the text before the meta list
+    activity_reference = _REFERENCE(activity_section)[0].strip()
 
     # Format the date to YYYY-MM-DD
-    try:
+    formatted_date = None
+    if date:
         # Remove day name if present (e.g., "Monday 17 February" -> "17 February")
         date_parts = date.split(" ", 1)
         date_without_day = date_parts[1] if len(date_parts) > 1 else date_parts[0]
+        formatted_date = _parse_date(
+            date_without_day, _calendar_year(date_without_day, year, week)
+        )
 
-        # Parse and format the date
-        parsed_date = datetime.strptime(f"{date_without_day} {year}", "%d %B %Y")
-        formatted_date = parsed_date.strftime("%Y-%m-%d")
-    except Exception as e:
-        # debug_log(f"Error parsing date {date}: {str(e)}")
+    if formatted_date is None:
+        # debug_log(f"Error parsing date {date}")
         debug_log("Error parsing date")
-        formatted_date = None
 
     # Get start and finish times
-    time_div = activity_section.find("div", {"class": "time"}).get_text(strip=True)
+    time_div = _stripped_text(_TIME(activity_section)[0])
     start_time, finish_time = time_div.split(" - ")
 
     # Get attendance state
-    status_div = activity_section.find("div", {"class": "activity-status"})
-    status_class = status_div.get("class", [])[
-        -1
-    ]  # Get the last class which contains the status
-    attendance_state = {
-        "activity-status-present": "present",
-        "activity-status-absent-unapproved": "absent",
-        "activity-status-undetermined": "unknown",
-    }.get(status_class, "unknown")
+    # The last class on the status div contains the status
+    status_class = _STATUS_CLASS(activity_section)[0].split()[-1]
+    attendance_state = _STATUS_MAP.get(status_class, "unknown")
 
     # Get location and lecturer name
-    meta_li = (
-        activity_section.find("ul", {"class": "meta"}).find("li").get_text(strip=True)
-    )
+    meta_li = _stripped_text(_META(activity_section)[0])
     location = None
     lecturer_name = None
 
@@ -83,7 +153,7 @@ def parse_activity(
 
 def fetch_attendance_page(
     session_token: str, email: str, year: int, week: int
-) -> Tuple[Optional[BeautifulSoup], Optional[List[Dict[str, Optional[str]]]]]:
+) -> Tuple[Optional[html.HtmlElement], Optional[List[Dict[str, Optional[str]]]]]:
     """Fetch attendance data from the checkin portal for a specific year and week.
 
     Args:
@@ -94,7 +164,7 @@ def fetch_attendance_page(
 
     Returns:
         Tuple containing:
-            - BeautifulSoup object of the page
+            - Parsed lxml document of the page
             - List of parsed activities
         Returns (None, None) if fetch fails or session is invalid
     """
@@ -111,8 +181,10 @@ def fetch_attendance_page(
         # Fetch the attendance page
         # debug_log(f"Making request to {CHECKIN_URL}/attendance/{year}/{week}")
 
-        response = requests.get(
-            f"{CHECKIN_URL}/attendance/{str(year)}/{str(week)}", headers=headers
+        response = get_checkin_session().get(
+            f"{CHECKIN_URL}/attendance/{str(year)}/{str(week)}",
+            headers=headers,
+            timeout=TIMEOUT,
         )
 
         # debug_log(f"Response status code: {response.status_code}")
@@ -123,10 +195,17 @@ def fetch_attendance_page(
 
         # Parse the page content
         debug_log("Parsing response content")
-        soup = BeautifulSoup(response.content.decode(), "html.parser")
+        # Query the lxml tree with precompiled XPath rather than walking it
+        # with BeautifulSoup's Python-level find calls
+        # The portal serves UTF-8 without always declaring it in the page, and
+        # lxml would otherwise fall back to Latin-1. Parsers shouldn't be shared
+        # between the fetch threads, so each page gets its own
+        page = html.document_fromstring(
+            response.content, parser=html.HTMLParser(encoding="utf-8")
+        )
 
         # Verify we got a valid page by checking title
-        title = soup.find("title").text
+        title = _TITLE(page)
         # debug_log(f"Page title: {title}")
 
         if title == "Please log in to continue...":
@@ -134,12 +213,12 @@ def fetch_attendance_page(
             return None, None
 
         # Verify the email matches
-        page_email = soup.find("span", {"class": "side-menu-title side-menu-name"})
+        page_email = _PAGE_EMAIL(page)
         if not page_email:
             debug_log("Could not find email in page")
             return None, None
 
-        page_email_text = page_email.text.strip()
+        page_email_text = page_email[0].text_content().strip()
         if page_email_text != email:
             # debug_log(f"Email mismatch: expected {email}, got {page_email_text}")
             debug_log("Email mismatch detected")
@@ -150,24 +229,19 @@ def fetch_attendance_page(
         current_date = None
 
         # Find all activity line items (date containers)
-        activity_lines = soup.find_all("article", {"class": "activity-line-item"})
-
-        for line in activity_lines:
+        for line in _ACTIVITY_LINES(page):
             # Get the date for this group of activities
-            date_div = line.find("div", {"class": "activity-line-date"})
+            date_div = _LINE_DATE(line)
             if date_div:
-                current_date = date_div.get_text(strip=True)
+                current_date = _stripped_text(date_div[0])
 
             # Find all activities under this date
-            activity_sections = line.find_all(
-                "section", {"class": "activity-line-action"}
-            )
-            for activity_section in activity_sections:
-                activity = parse_activity(activity_section, current_date, year)
+            for activity_section in _LINE_SECTIONS(line):
+                activity = parse_activity(activity_section, current_date, year, week)
                 activities.append(activity)
 
         # debug_log(f"Found {len(activities)} activities")
-        return soup, activities
+        return page, activities
 
     except Exception as e:
         # debug_log(f"Error fetching attendance page: {str(e)}")
@@ -182,7 +256,7 @@ if __name__ == "__main__":
     current_year = datetime.now().year
     current_week = datetime.now().isocalendar()[1]
 
-    soup, activities = fetch_attendance_page(
+    page, activities = fetch_attendance_page(
         test_token, test_email, current_year, current_week
     )
     if activities:
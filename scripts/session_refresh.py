@@ -1,16 +1,20 @@
 from typing import List, Dict, Any, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
 from api.state import state
 from datetime import datetime, timezone
-import requests
 from bs4 import BeautifulSoup
 import os
 import json
-from api.checkout_client import CheckOutClient, CheckOutAPIError
-from api.utils import get_utc_timestamp, debug_log
+from api.checkout_client import get_default_client, CheckOutAPIError
+from api.utils import get_utc_timestamp, debug_log, DEBUG
+from scripts.checkin_session import get_checkin_session, TIMEOUT
 
 # Get the checkin URL from environment variables
 CHECKIN_URL = os.getenv("CHECKIN_URL", "https://checkin.york.ac.uk")
 
+# Maximum number of sessions refreshed concurrently by a manual refresh
+MAX_REFRESH_WORKERS = 8
+
 
 def log(email: str, state: str, message: str) -> None:
     """
@@ -21,13 +25,14 @@ def log(email: str, state: str, message: str) -> None:
         state: Status of the operation ('Normal', 'Fail', etc.)
         message: Detailed message about the operation
     """
-    debug_log(f"\nLogging event to CheckOut API")
-    debug_log(f"Email: {email}")
-    debug_log(f"State: {state}")
-    debug_log(f"Message: {message}")
+    if DEBUG:
+        debug_log(f"\nLogging event to CheckOut API")
+        debug_log(f"Email: {email}")
+        debug_log(f"State: {state}")
+        debug_log(f"Message: {message}")
 
     try:
-        client = CheckOutClient()
+        client = get_default_client()
         payload = {"email": email, "state": state, "message": message}
 
         debug_log(f"Making POST request to log endpoint")
@@ -73,9 +78,10 @@ def refresh_session_token(
         # Fetch the self-registration page
         debug_log("Making request to checkin.york.ac.uk/selfregistration")
 
-        req = requests.get(
+        req = get_checkin_session().get(
             f"{CHECKIN_URL}/selfregistration",
             headers=headers,
+            timeout=TIMEOUT,
         )
 
         # debug_log(f"Response status code: {req.status_code}")
@@ -193,7 +199,7 @@ def refresh_session_token(
         try:
             debug_log("Notifying CheckOut API about token update")
 
-            client = CheckOutClient()
+            client = get_default_client()
             update_payload = {
                 "email": email,
                 "oldtoken": checkin_token,
@@ -252,45 +258,55 @@ def update_stored_sessions(
     debug_log(f"Target email: {email if email else 'all users'}")
     debug_log(f"Number of sessions to process: {len(sessions)}")
 
-    updated_sessions = []
+    # Refresh every targeted session concurrently; each refresh is an
+    # independent round trip to the checkin site
+    with ThreadPoolExecutor(max_workers=MAX_REFRESH_WORKERS) as executor:
+        futures = {
+            id(session): executor.submit(
+                refresh_session_token, session["email"], session["checkintoken"]
+            )
+            for session in sessions
+            if (email is None or session.get("email") == email)
+            and session.get("email")
+            and session.get("checkintoken")
+        }
+        new_tokens = {key: future.result() for key, future in futures.items()}
+
     current_time = get_utc_timestamp()
 
     for session in sessions:
         current_email = session.get("email")
-        current_token = session.get("checkintoken")
 
-        debug_log(f"\nProcessing session for {current_email}")
+        if DEBUG:
+            debug_log(f"\nProcessing session for {current_email}")
 
         # Skip if not the target email (when updating single user)
         if email is not None and current_email != email:
-            debug_log(f"Skipping {current_email} - not target email")
-            updated_sessions.append(session)
+            if DEBUG:
+                debug_log(f"Skipping {current_email} - not target email")
             continue
 
-        if current_email and current_token:
-            debug_log(f"Attempting to refresh token for {current_email}")
-            new_token = refresh_session_token(current_email, current_token)
-            if new_token:
-                debug_log(f"Token refresh successful for {current_email}")
-                session.update(
-                    {
-                        "checkintoken": new_token,
-                        "checkinReport": "Normal",
-                        "checkinReportTime": current_time,
-                    }
-                )
-            else:
-                debug_log(f"Token refresh failed for {current_email}")
-                session.update(
-                    {"checkinReport": "Fail", "checkinReportTime": current_time}
-                )
-        else:
+        if id(session) not in new_tokens:
             debug_log(f"Missing email or token for session")
+            continue
 
-        updated_sessions.append(session)
+        new_token = new_tokens[id(session)]
+        if new_token:
+            if DEBUG:
+                debug_log(f"Token refresh successful for {current_email}")
+            values = {
+                "checkintoken": new_token,
+                "checkinReport": "Normal",
+                "checkinReportTime": current_time,
+            }
+        else:
+            if DEBUG:
+                debug_log(f"Token refresh failed for {current_email}")
+            values = {"checkinReport": "Fail", "checkinReportTime": current_time}
 
-    debug_log(f"\nUpdating global state with {len(updated_sessions)} sessions")
-    state.set_data("autoCheckinUsers", updated_sessions)
+        # Apply each result to the current stored user rather than writing
+        # back the list read before the refreshes, which may be stale by now
+        state.update_user(current_email, values)
 
 
 def get_all_refresh_sessions() -> List[Dict[str, Any]]:
@@ -305,7 +321,8 @@ def get_all_refresh_sessions() -> List[Dict[str, Any]]:
     state.set_data("last_all_session_refresh", current_time)
 
     debug_log("All sessions refresh complete")
-    return sessions
+    # The refreshed users are stored as new dicts, so return the stored list
+    return state.get_data("autoCheckinUsers") or []
 
 
 def get_refresh_session_by_email(email: str) -> Optional[Dict[str, Any]]:
@@ -322,6 +339,7 @@ def get_refresh_session_by_email(email: str) -> Optional[Dict[str, Any]]:
         update_stored_sessions(sessions, email)
         current_time = get_utc_timestamp()
         state.set_data("last_individual_session_refresh", current_time)
+        session = state.get_user(email)
     else:
         debug_log(f"No session found for {email}")
 